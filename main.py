@@ -3,11 +3,19 @@ from discord.ext import commands, tasks
 import os
 import random
 import asyncio
-import json
 from datetime import datetime, timedelta
 from keep_alive import keep_alive
+from storage import (
+    init_db, flush_db, flush_db_async, FLUSH_INTERVAL, db, guild_data, save_guild_data_async,
+    load_guild, evict_guild, evict_idle_guilds, get_automod_count, set_automod_count,
+    load_json, save_json_async, TIMERS_PATH
+)
 import re
 import time
+from collections import OrderedDict, deque
+from bisect import bisect_left, insort
+import heapq
+import itertools
 
 # Bot setup
 intents = discord.Intents.default()
@@ -15,37 +23,6 @@ intents.message_content = True
 intents.members = True
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-# JSON Database functions
-def init_db():
-    """Initialize JSON database files"""
-    db_files = {
-        'warnings.json': [],
-        'user_levels.json': {},
-        'guild_config.json': {},
-        'level_roles.json': {},
-        'automod_warnings.json': {},
-        'user_accounts.json': {},
-        'tickets.json': []
-    }
-    
-    for filename, default_data in db_files.items():
-        if not os.path.exists(filename):
-            with open(filename, 'w') as f:
-                json.dump(default_data, f)
-
-def load_json(filename):
-    """Load data from JSON file"""
-    try:
-        with open(filename, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {} if filename != 'warnings.json' and filename != 'tickets.json' else []
-
-def save_json(filename, data):
-    """Save data to JSON file"""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
-
 # Helper functions
 def parse_time(time_str):
     """Parse time string like '1h', '30m', '2d' into timedelta"""
@@ -70,53 +47,308 @@ def parse_time(time_str):
     
     return None
 
+def parse_id_set(value):
+    """Parse a comma separated list of ids into a frozenset of ints"""
+    return frozenset(int(part) for part in str(value or '').split(',') if part.strip().isdigit())
+
+class GuildConfig:
+    """Parsed view of a guild's config, rebuilt only when the config changes"""
+    
+    def __init__(self, data):
+        self.automod_enabled = bool(data.get('automod_enabled'))
+        self.automod_log_channel = data.get('automod_log_channel')
+        self.automod_log_digest = bool(data.get('automod_log_digest'))
+        self.spam_channels = parse_id_set(data.get('spam_channels'))
+        self.link_channels = parse_id_set(data.get('link_channels'))
+        self.staff_roles = parse_id_set(data.get('staff_roles'))
+        # Opt-in rules stay off until staff turn them on
+        enabled_rules = data.get('automod_enabled_rules', [])
+        self.disabled_rules = frozenset(data.get('automod_disabled_rules', [])) | frozenset(
+            rule.name for rule in AUTOMOD_RULES if not rule.default_enabled and rule.name not in enabled_rules
+        )
+        self.bad_words = data.get('bad_words', BAD_WORDS)
+        self.welcomer_enabled = bool(data.get('welcomer_enabled'))
+        self.welcomer_channel = data.get('welcomer_channel')
+        self.leveling_channel = data.get('leveling_channel')
+        self.verified_role = int(data['verified_role']) if data.get('verified_role') else None
+        self.raid_threshold = int(data.get('raid_threshold') or 0)
+        self.raid_action = data.get('raid_action', 'alert')
+        self._bad_word_matcher = None
+    
+    @property
+    def bad_word_matcher(self):
+        """Compiled bad words matcher, built on first use"""
+        if self._bad_word_matcher is None:
+            self._bad_word_matcher = BadWordMatcher(self.bad_words)
+        return self._bad_word_matcher
+
+# Parsed config per guild
+guild_configs = {}
+
+def get_guild_config(guild_id):
+    """Return the parsed config of a guild"""
+    config = guild_configs.get(guild_id)
+    if config is None:
+        config = guild_configs[guild_id] = GuildConfig(guild_data(guild_id, 'config'))
+    return config
+
+async def save_guild_config(guild_id):
+    """Save a guild's raw config after a change and drop its parsed copy"""
+    guild_configs.pop(guild_id, None)
+    await save_guild_data_async(guild_id, 'config')
+
 async def is_staff(ctx):
     """Check if user is staff (has manage messages permission or has staff role)"""
     if ctx.author.guild_permissions.manage_messages:
         return True
     
     # Check if user has any staff roles
-    guild_config = load_json('guild_config.json')
-    config = guild_config.get(str(ctx.guild.id), {})
-    staff_roles = config.get('staff_roles', '')
+    staff_roles = get_guild_config(ctx.guild.id).staff_roles
+    return any(role.id in staff_roles for role in ctx.author.roles)
+
+async def update_member_roles(member, add=(), remove=(), reason=None):
+    """Apply role changes to a member with a single API call
+    
+    Returns False without calling the API when nothing would change.
+    """
+    current = set(member.roles)
+    target = (current | set(add)) - set(remove)
+    if target == current:
+        return False
+    
+    await member.edit(roles=[role for role in target if not role.is_default()], reason=reason)
+    return True
+
+# Outbound API calls from event handlers, run by priority so moderation never waits on cosmetics
+PRIORITY_MODERATION = 0
+PRIORITY_LOG = 1
+PRIORITY_DM = 2
+PRIORITY_ANNOUNCE = 3
+ACTION_WORKERS = 8
+ROUTE_CONCURRENCY = 2
+# Past this many waiting actions on a route, the oldest DMs and announcements are dropped
+MAX_ROUTE_BACKLOG = 100
+
+# Actions ready to run. A route never has more than ROUTE_CONCURRENCY actions
+# here or running, the rest wait in its backlog, so a busy route cannot tie up
+# workers that other routes need.
+action_queue = asyncio.PriorityQueue()
+action_sequence = itertools.count()
+route_active = {}
+route_backlog = {}
+action_workers = []
+action_stats = {'dropped': 0}
+
+def enqueue_action(priority, route, action):
+    """Queue a zero argument coroutine function to run on the given route"""
+    item = (priority, next(action_sequence), route, action)
+    if route_active.get(route, 0) < ROUTE_CONCURRENCY:
+        route_active[route] = route_active.get(route, 0) + 1
+        action_queue.put_nowait(item)
+    else:
+        backlog = route_backlog.setdefault(route, [])
+        heapq.heappush(backlog, item)
+        if len(backlog) > MAX_ROUTE_BACKLOG:
+            # Moderation is never dropped, only what would arrive too late to matter
+            droppable = [entry for entry in backlog if entry[0] >= PRIORITY_DM]
+            if droppable:
+                backlog.remove(min(droppable, key=lambda entry: entry[1]))
+                heapq.heapify(backlog)
+                action_stats['dropped'] += 1
+
+def release_route(route):
+    """Hand a finished action's slot to the next action waiting on its route"""
+    backlog = route_backlog.get(route)
+    if backlog:
+        action_queue.put_nowait(heapq.heappop(backlog))
+        if not backlog:
+            del route_backlog[route]
+    elif route_active[route] > 1:
+        route_active[route] -= 1
+    else:
+        del route_active[route]
+
+async def action_worker():
+    """Run queued actions, at most ROUTE_CONCURRENCY at a time per route"""
+    while True:
+        _, _, route, action = await action_queue.get()
+        try:
+            await action()
+        except Exception as e:
+            print(f"Error running queued action on {route}: {e}")
+        finally:
+            release_route(route)
+            action_queue.task_done()
+
+# Users whose DMs recently failed, so we skip sends that would be refused again
+DM_FAILURE_TTL = 6 * 60 * 60
+MAX_CLOSED_DMS = 50000
+
+# user_id -> time.monotonic() when we try them again, oldest first
+closed_dms = OrderedDict()
+dm_stats = {'sent': 0, 'failed': 0, 'skipped': 0}
+
+async def send_dm(user, content):
+    """DM a user unless their DMs are known to be closed"""
+    retry_at = closed_dms.get(user.id)
+    if retry_at is not None:
+        if time.monotonic() < retry_at:
+            dm_stats['skipped'] += 1
+            return False
+        del closed_dms[user.id]
     
-    if staff_roles:
-        staff_role_ids = staff_roles.split(',')
-        user_role_ids = [str(role.id) for role in ctx.author.roles]
-        return any(role_id in staff_role_ids for role_id in user_role_ids)
+    try:
+        await user.send(content)
+    except discord.Forbidden:
+        dm_stats['failed'] += 1
+        closed_dms[user.id] = time.monotonic() + DM_FAILURE_TTL
+        if len(closed_dms) > MAX_CLOSED_DMS:
+            closed_dms.popitem(last=False)
+        return False
     
-    return False
+    dm_stats['sent'] += 1
+    return True
 
-# Bad words list (basic example - you can expand this)
+def start_action_workers():
+    """Start the action workers if they are not running yet"""
+    action_workers[:] = [task for task in action_workers if not task.done()]
+    while len(action_workers) < ACTION_WORKERS:
+        action_workers.append(asyncio.create_task(action_worker()))
+
+# Default bad words list, used until staff set one with !badwords
 BAD_WORDS = ['badword1', 'badword2', 'spam', 'test_bad']
 
+class BadWordMatcher:
+    """Aho-Corasick automaton over a bad words list
+    
+    A bad word counts when a word in the message starts with it, ends with it
+    or is it. Scanning costs the same no matter how long the list is.
+    """
+    
+    def __init__(self, words):
+        self.words = sorted({w.lower() for w in words if w and not any(c.isspace() for c in w)})
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        
+        # Build the trie
+        for index, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state] += (index,)
+        
+        # Breadth-first pass to set failure links and merge outputs
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+    
+    def count(self, content):
+        """Return how many different bad words appear at the start or end of a word"""
+        matched = set()
+        state = 0
+        token_start = 0
+        goto, fail, output, words = self.goto, self.fail, self.output, self.words
+        
+        for i, char in enumerate(content.lower()):
+            if char.isspace():
+                # Everything matched at the last character ends the word
+                matched.update(output[state])
+                state = 0
+                token_start = i + 1
+                continue
+            
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            
+            for index in output[state]:
+                if i - len(words[index]) + 1 == token_start:
+                    matched.add(index)
+        
+        matched.update(output[state])
+        return len(matched)
+
+# Recent messages per channel, newest first, so spam checks don't need channel.history
+SPAM_WINDOW_SECONDS = 5
+SPAM_HISTORY_SIZE = 6
+MAX_TRACKED_CHANNELS = 5000
+EMOJI_PATTERN = re.compile(r'<:[^:]+:\d+>|[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]')
+
+class RecentMessage:
+    __slots__ = ('message_id', 'author_id', 'timestamp', 'content_hash', 'emoji_count')
+    
+    def __init__(self, message_id, author_id, timestamp, content_hash, emoji_count):
+        self.message_id = message_id
+        self.author_id = author_id
+        self.timestamp = timestamp
+        self.content_hash = content_hash
+        self.emoji_count = emoji_count
+
+# channel_id -> deque of RecentMessage, least recently active channel first
+recent_messages = OrderedDict()
+
+def record_message(message):
+    """Remember a message for the spam checks"""
+    if not message.guild:
+        return
+    
+    now = time.monotonic()
+    history = recent_messages.get(message.channel.id)
+    if history is None:
+        history = recent_messages[message.channel.id] = deque(maxlen=SPAM_HISTORY_SIZE)
+    else:
+        recent_messages.move_to_end(message.channel.id)
+    history.appendleft(RecentMessage(
+        message.id,
+        message.author.id,
+        now,
+        hash(message.content),
+        len(EMOJI_PATTERN.findall(message.content))
+    ))
+    
+    # Drop channels that went quiet, their history is too old to matter
+    while recent_messages:
+        channel_id, oldest = next(iter(recent_messages.items()))
+        if len(recent_messages) <= MAX_TRACKED_CHANNELS and now - oldest[0].timestamp <= SPAM_WINDOW_SECONDS:
+            break
+        del recent_messages[channel_id]
+
+def recent_author_messages(message):
+    """Yield the author's latest consecutive messages in the channel from the last 5 seconds"""
+    now = time.monotonic()
+    for entry in recent_messages.get(message.channel.id, ()):
+        if entry.author_id != message.author.id or now - entry.timestamp > SPAM_WINDOW_SECONDS:
+            break
+        yield entry
+
 # Automod functions
 async def check_spam(message):
     """Check if message is spam (5 same consecutive messages in 5 seconds)"""
     if not message.guild:
         return False
     
-    channel = message.channel
     count = 0
-    now = datetime.now()
     last_content = None
     
-    async for msg in channel.history(limit=6):
-        if msg.author == message.author:
-            # Check if message is within 5 seconds and has same content
-            msg_time = msg.created_at.replace(tzinfo=None)
-            time_diff = (now - msg_time).total_seconds()
-            
-            if time_diff <= 5:
-                if last_content is None:
-                    last_content = msg.content
-                    count = 1
-                elif msg.content == last_content:
-                    count += 1
-                else:
-                    break
-            else:
-                break
+    for entry in recent_author_messages(message):
+        if last_content is None:
+            last_content = entry.content_hash
+            count = 1
+        elif entry.content_hash == last_content:
+            count += 1
         else:
             break
     
@@ -127,76 +359,362 @@ async def check_emoji_spam(message):
     if not message.guild:
         return False
     
-    channel = message.channel
     count = 0
-    now = datetime.now()
-    emoji_pattern = r'<:[^:]+:\d+>|[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF]'
     
-    async for msg in channel.history(limit=6):
-        if msg.author == message.author:
-            msg_time = msg.created_at.replace(tzinfo=None)
-            time_diff = (now - msg_time).total_seconds()
-            
-            if time_diff <= 5:
-                emojis = re.findall(emoji_pattern, msg.content)
-                if len(emojis) > 5:  # Message has more than 5 emojis
-                    count += 1
-                else:
-                    break
-            else:
-                break
+    for entry in recent_author_messages(message):
+        if entry.emoji_count > 5:  # Message has more than 5 emojis
+            count += 1
         else:
             break
     
     return count >= 5
 
-async def check_bad_words(content):
+async def check_bad_words(content, guild_id):
     """Check if message contains 3 or more bad words"""
-    content_lower = content.lower()
-    bad_word_count = 0
-    
-    for bad_word in BAD_WORDS:
-        # Check if bad word is at start, end, or standalone
-        words = content_lower.split()
-        for word in words:
-            if word.startswith(bad_word) or word.endswith(bad_word) or word == bad_word:
-                bad_word_count += 1
-                break
-    
-    return bad_word_count >= 3
+    return get_guild_config(guild_id).bad_word_matcher.count(content) >= 3
+
+URL_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
 
 async def check_links(content):
     """Check if message contains links"""
-    url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-    return bool(re.search(url_pattern, content))
+    return bool(URL_PATTERN.search(content))
+
+# Rolling index of recent message fingerprints per guild, for spam repeated across channels or accounts
+DUPLICATE_WINDOW_SECONDS = 30
+DUPLICATE_MIN_LENGTH = 24
+DUPLICATE_CHANNEL_THRESHOLD = 3
+DUPLICATE_AUTHOR_THRESHOLD = 4
+MAX_GUILD_FINGERPRINTS = 2000
+MAX_FINGERPRINT_GUILDS = 1000
+
+def content_fingerprint(content):
+    """Hash message content with case and spacing normalized, or None if it is too short to judge"""
+    normalized = ' '.join(content.lower().split())
+    if len(normalized) < DUPLICATE_MIN_LENGTH:
+        return None
+    return hash(normalized)
+
+class FingerprintStats:
+    __slots__ = ('occurrences', 'author_channels', 'removed')
+    
+    def __init__(self):
+        # (author_id, channel_id, message_id), oldest first
+        self.occurrences = deque()
+        # author_id -> {channel_id: count}
+        self.author_channels = {}
+        # Message ids already queued for deletion
+        self.removed = set()
+
+class GuildFingerprints:
+    """Fingerprints seen in a guild within the duplicate window"""
+    
+    def __init__(self):
+        # (timestamp, fingerprint), oldest first
+        self.order = deque()
+        self.stats = {}
+    
+    def expire(self, now):
+        while self.order and (now - self.order[0][0] > DUPLICATE_WINDOW_SECONDS or len(self.order) > MAX_GUILD_FINGERPRINTS):
+            _, fingerprint = self.order.popleft()
+            stats = self.stats[fingerprint]
+            author_id, channel_id, message_id = stats.occurrences.popleft()
+            stats.removed.discard(message_id)
+            channels = stats.author_channels[author_id]
+            channels[channel_id] -= 1
+            if not channels[channel_id]:
+                del channels[channel_id]
+                if not channels:
+                    del stats.author_channels[author_id]
+            if not stats.occurrences:
+                del self.stats[fingerprint]
+    
+    def add(self, now, fingerprint, message):
+        """Record a message and return the stats of its fingerprint"""
+        self.order.append((now, fingerprint))
+        stats = self.stats.get(fingerprint)
+        if stats is None:
+            stats = self.stats[fingerprint] = FingerprintStats()
+        stats.occurrences.append((message.author.id, message.channel.id, message.id))
+        channels = stats.author_channels.setdefault(message.author.id, {})
+        channels[message.channel.id] = channels.get(message.channel.id, 0) + 1
+        self.expire(now)
+        return stats
+
+# guild_id -> GuildFingerprints, least recently active guild first
+guild_fingerprints = OrderedDict()
+
+def record_fingerprint(message):
+    """Add a message to its guild's fingerprint index and return the stats of its content"""
+    fingerprint = content_fingerprint(message.content)
+    if fingerprint is None:
+        return None
+    
+    now = time.monotonic()
+    index = guild_fingerprints.get(message.guild.id)
+    if index is None:
+        index = guild_fingerprints[message.guild.id] = GuildFingerprints()
+    else:
+        guild_fingerprints.move_to_end(message.guild.id)
+    stats = index.add(now, fingerprint, message)
+    
+    # Drop guilds that went quiet, or the least active ones once over the cap
+    while guild_fingerprints:
+        guild_id, oldest = next(iter(guild_fingerprints.items()))
+        if len(guild_fingerprints) <= MAX_FINGERPRINT_GUILDS and now - oldest.order[-1][0] <= DUPLICATE_WINDOW_SECONDS:
+            break
+        del guild_fingerprints[guild_id]
+    
+    return stats
+
+def duplicate_copies(message):
+    """Return {channel_id: [message_ids]} of the other copies of a message that should go
+    
+    That is the author's own copies, or every account's copies once enough
+    accounts posted it. Copies returned here are not returned again.
+    """
+    index = guild_fingerprints.get(message.guild.id)
+    stats = index.stats.get(content_fingerprint(message.content)) if index else None
+    if stats is None:
+        return {}
+    every_author = len(stats.author_channels) >= DUPLICATE_AUTHOR_THRESHOLD
+    copies = {}
+    for author_id, channel_id, message_id in stats.occurrences:
+        if (every_author or author_id == message.author.id) and message_id != message.id and message_id not in stats.removed:
+            copies.setdefault(channel_id, []).append(message_id)
+            stats.removed.add(message_id)
+    stats.removed.add(message.id)
+    return copies
+
+async def check_duplicate_content(message):
+    """Check if the author posted the same content in several channels, or several accounts did recently"""
+    stats = record_fingerprint(message)
+    if stats is None:
+        return False
+    return (
+        len(stats.author_channels[message.author.id]) >= DUPLICATE_CHANNEL_THRESHOLD
+        or len(stats.author_channels) >= DUPLICATE_AUTHOR_THRESHOLD
+    )
+
+# Automod rule pipeline
+class AutomodRule:
+    """One automod check with its relative cost and usage stats
+    
+    Rules run cheapest first. Rules with the same cost run concurrently, and
+    once a short-circuiting rule hits, the more expensive ones are skipped.
+    """
+    
+    def __init__(self, name, violation, check, cost, short_circuit=True, default_enabled=True):
+        self.name = name
+        self.violation = violation
+        self.check = check
+        self.cost = cost
+        self.short_circuit = short_circuit
+        self.default_enabled = default_enabled
+        self.runs = 0
+        self.hits = 0
+        self.total_time = 0.0
+    
+    async def run(self, message, config):
+        start = time.perf_counter()
+        try:
+            hit = await self.check(message, config)
+        finally:
+            self.runs += 1
+            self.total_time += time.perf_counter() - start
+        if hit:
+            self.hits += 1
+        return hit
+
+async def spam_rule(message, config):
+    # Spam is allowed in spam channels
+    if message.channel.id in config.spam_channels:
+        return False
+    return await check_spam(message)
+
+async def duplicate_rule(message, config):
+    # Spam channels are left out of the duplicate index entirely
+    if message.channel.id in config.spam_channels:
+        return False
+    return await check_duplicate_content(message)
+
+async def emoji_spam_rule(message, config):
+    return await check_emoji_spam(message)
+
+async def bad_words_rule(message, config):
+    return await check_bad_words(message.content, message.guild.id)
+
+async def links_rule(message, config):
+    # Links are allowed in link channels
+    if message.channel.id in config.link_channels:
+        return False
+    return await check_links(message.content)
+
+AUTOMOD_RULES = [
+    AutomodRule('spam', "spam", spam_rule, cost=1),
+    AutomodRule('emoji', "emoji spam", emoji_spam_rule, cost=1),
+    AutomodRule('duplicates', "cross-channel spam", duplicate_rule, cost=1, default_enabled=False),
+    AutomodRule('links', "unauthorized links", links_rule, cost=2),
+    AutomodRule('badwords', "inappropriate language", bad_words_rule, cost=3)
+]
+
+# Rules grouped by cost, cheapest group first
+AUTOMOD_TIERS = [
+    [rule for rule in AUTOMOD_RULES if rule.cost == cost]
+    for cost in sorted({rule.cost for rule in AUTOMOD_RULES})
+]
+
+async def run_automod_rules(message, config):
+    """Run the guild's enabled automod rules and return the violations found"""
+    violations = []
+    
+    for tier in AUTOMOD_TIERS:
+        rules = [rule for rule in tier if rule.name not in config.disabled_rules]
+        if not rules:
+            continue
+        
+        results = await asyncio.gather(*(rule.run(message, config) for rule in rules))
+        hits = [rule for rule, hit in zip(rules, results) if hit]
+        violations.extend(rule.violation for rule in hits)
+        
+        if any(rule.short_circuit for rule in hits):
+            break
+    
+    return violations
 
 # Bot events
 @bot.event
 async def on_ready():
+    global timer_task
     print(f'{bot.user} has logged in!')
-    init_db()
-    if not level_check.is_running():
-        level_check.start()
+    start_action_workers()
+    if timer_task is None or timer_task.done():
+        timer_task = asyncio.create_task(run_timers())
+    if not level_role_sync.is_running():
+        level_role_sync.start()
+    if not db_flush.is_running():
+        db_flush.start()
+    if not guild_eviction.is_running():
+        guild_eviction.start()
+    if not xp_flush.is_running():
+        xp_flush.start()
+
+@bot.event
+async def on_guild_remove(guild):
+    """Unload the data of guilds the bot has left"""
+    guild_configs.pop(guild.id, None)
+    leaderboards.pop(guild.id, None)
+    ban_indexes.pop(guild.id, None)
+    join_history.pop(guild.id, None)
+    flush_xp_records(guild.id)
+    await evict_guild(guild.id)
 
 @bot.event
 async def on_member_join(member):
     """Handle new member joins for welcomer system"""
-    guild_id = str(member.guild.id)
+    await load_guild(member.guild.id)
+    
+    # Returning members get their level roles back
+    queue_level_role_check(member.guild.id, member.id)
+    
+    config = get_guild_config(member.guild.id)
+    joins = record_join(member.guild.id)
     
-    guild_config = load_json('guild_config.json')
-    config = guild_config.get(guild_id, {})
+    if config.raid_threshold and joins >= config.raid_threshold:
+        await handle_raid_join(member, config, joins)
+        if config.raid_action in ('kick', 'ban'):
+            return
     
-    if config.get('welcomer_enabled') and config.get('welcomer_channel'):
-        channel = bot.get_channel(config['welcomer_channel'])
+    if config.welcomer_enabled and config.welcomer_channel:
+        channel = bot.get_channel(config.welcomer_channel)
         if channel:
-            welcome_message = f"Welcome! <@{member.id}> Thanks for joining my server you are **GOAT** <:w_trkis:1400194042234667120> <:GOAT:1400194575125188811>"
-            await channel.send(welcome_message)
+            # During a burst of joins, welcome everyone together in one message
+            if joins >= JOIN_BURST_THRESHOLD or member.guild.id in pending_welcomes:
+                queue_welcome(member, channel)
+            else:
+                enqueue_action(PRIORITY_ANNOUNCE, f"send:{channel.id}", lambda: channel.send(welcome_message([member.id])))
+
+# Join rate per guild over a sliding window, used to batch welcomes and spot raids
+JOIN_WINDOW_SECONDS = 10
+JOIN_BURST_THRESHOLD = 3
+WELCOME_BATCH_DELAY = 5
+WELCOME_BATCH_SIZE = 40
+RAID_ALERT_COOLDOWN = 60
+RAID_MUTE_DURATION = timedelta(minutes=30)
+RAID_ACTIONS = ('alert', 'mute', 'kick', 'ban')
+
+join_history = {}
+pending_welcomes = {}
+# Running batched welcome tasks, kept so they are not garbage collected
+welcome_tasks = set()
+raid_alerts = {}
+
+def record_join(guild_id):
+    """Record a join and return how many joins the guild had within the window"""
+    now = time.monotonic()
+    history = join_history.setdefault(guild_id, deque())
+    history.append(now)
+    while history[0] <= now - JOIN_WINDOW_SECONDS:
+        history.popleft()
+    return len(history)
+
+def welcome_message(user_ids):
+    """Build the welcome message for one or more new members"""
+    mentions = ' '.join(f"<@{user_id}>" for user_id in user_ids)
+    return f"Welcome! {mentions} Thanks for joining my server you are **GOAT** <:w_trkis:1400194042234667120> <:GOAT:1400194575125188811>"
+
+def queue_welcome(member, channel):
+    """Add a member to the guild's next batched welcome"""
+    pending = pending_welcomes.get(member.guild.id)
+    if pending is None:
+        pending = pending_welcomes[member.guild.id] = []
+        task = asyncio.create_task(send_batched_welcomes(member.guild.id, channel))
+        welcome_tasks.add(task)
+        task.add_done_callback(welcome_tasks.discard)
+    pending.append(member.id)
+
+async def send_batched_welcomes(guild_id, channel):
+    """Welcome everyone who joined in the last few seconds"""
+    await asyncio.sleep(WELCOME_BATCH_DELAY)
+    user_ids = pending_welcomes.pop(guild_id, [])
+    for i in range(0, len(user_ids), WELCOME_BATCH_SIZE):
+        content = welcome_message(user_ids[i:i + WELCOME_BATCH_SIZE])
+        enqueue_action(PRIORITY_ANNOUNCE, f"send:{channel.id}", lambda content=content: channel.send(content))
+
+async def handle_raid_join(member, config, joins):
+    """Alert staff and apply the raid action to a member joining during a raid"""
+    now = time.monotonic()
+    if config.automod_log_channel and now - raid_alerts.get(member.guild.id, -RAID_ALERT_COOLDOWN) >= RAID_ALERT_COOLDOWN:
+        raid_alerts[member.guild.id] = now
+        log_channel = bot.get_channel(config.automod_log_channel)
+        if log_channel:
+            embed = discord.Embed(
+                title="Raid Detected",
+                color=0xff0000,
+                timestamp=datetime.now()
+            )
+            embed.add_field(name="Joins", value=f"{joins} in {JOIN_WINDOW_SECONDS}s", inline=True)
+            embed.add_field(name="Action", value=config.raid_action, inline=True)
+            enqueue_action(PRIORITY_LOG, f"send:{log_channel.id}", lambda: log_channel.send(embed=embed))
+    
+    route = f"member:{member.guild.id}"
+    if config.raid_action == 'mute':
+        enqueue_action(PRIORITY_MODERATION, route, lambda: member.timeout(RAID_MUTE_DURATION, reason="Automod: raid protection"))
+    elif config.raid_action == 'kick':
+        enqueue_action(PRIORITY_MODERATION, route, lambda: member.kick(reason="Automod: raid protection"))
+    elif config.raid_action == 'ban':
+        enqueue_action(PRIORITY_MODERATION, route, lambda: member.ban(reason="Automod: raid protection"))
 
 @bot.event
 async def on_message(message):
+    # Bot messages are recorded too since they break up a spam streak
+    record_message(message)
+    
     if message.author.bot:
         return
     
+    if message.guild:
+        await load_guild(message.guild.id)
+    
     # Process leveling
     await process_leveling(message)
     
@@ -205,142 +723,277 @@ async def on_message(message):
     
     await bot.process_commands(message)
 
+# XP leaderboard per guild, kept sorted as (-xp, user_id) so rank lookups are a bisect
+class Leaderboard:
+    def __init__(self, records):
+        self.xp = {user_id: data.get('xp', 0) for user_id, data in records}
+        self.entries = sorted((-xp, user_id) for user_id, xp in self.xp.items())
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def update(self, user_id, xp):
+        """Move a member to their new XP position"""
+        old_xp = self.xp.get(user_id)
+        if old_xp == xp:
+            return
+        if old_xp is not None:
+            del self.entries[bisect_left(self.entries, (-old_xp, user_id))]
+        self.xp[user_id] = xp
+        insort(self.entries, (-xp, user_id))
+    
+    def rank(self, user_id):
+        """Return a member's 1-based rank, or None if they have no XP yet"""
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        return bisect_left(self.entries, (-xp, user_id)) + 1
+    
+    def top(self, start, count):
+        """Return (rank, user_id, xp) for a slice of the ranking"""
+        return [
+            (start + i + 1, user_id, -neg_xp)
+            for i, (neg_xp, user_id) in enumerate(self.entries[start:start + count])
+        ]
+
+leaderboards = {}
+
+def get_leaderboard(guild_id):
+    """Return the guild's leaderboard, building it on first use"""
+    board = leaderboards.get(guild_id)
+    if board is None:
+        flush_xp_records(guild_id)
+        board = leaderboards[guild_id] = Leaderboard(db.iter_levels(guild_id))
+    return board
+
+def update_leaderboard(guild_id, user_id, xp):
+    """Keep an already built leaderboard in step with an XP change"""
+    board = leaderboards.get(guild_id)
+    if board is not None:
+        board.update(user_id, xp)
+
+# XP is granted in memory and written to storage in batches
+XP_PER_MESSAGE = 15
+XP_COOLDOWN_SECONDS = 60
+XP_FLUSH_INTERVAL = int(os.getenv('XP_FLUSH_INTERVAL', 15))
+
+class XPRecord:
+    __slots__ = ('xp', 'level', 'last_message', 'next_grant')
+    
+    def __init__(self, data):
+        self.xp = data.get('xp', 0)
+        self.level = data.get('level', 0)
+        # Wall clock time is kept for storage, the monotonic deadline for cooldowns
+        self.last_message = 0.0
+        self.next_grant = 0.0
+        if 'last_message' in data:
+            try:
+                self.last_message = datetime.fromisoformat(data['last_message']).timestamp()
+                self.next_grant = time.monotonic() + XP_COOLDOWN_SECONDS - (time.time() - self.last_message)
+            except ValueError:
+                pass
+    
+    def as_dict(self):
+        return {
+            'xp': self.xp,
+            'level': self.level,
+            'last_message': datetime.fromtimestamp(self.last_message).isoformat()
+        }
+
+xp_records = {}
+xp_dirty = set()
+
+def get_xp_record(guild_id, user_id):
+    """Return a member's XP record, loading it from storage on first use"""
+    key = (guild_id, user_id)
+    record = xp_records.get(key)
+    if record is None:
+        record = xp_records[key] = XPRecord(db.get_level(guild_id, user_id) or {})
+    return record
+
+def get_member_level(guild_id, user_id):
+    """Return a member's leveling data, including XP not yet flushed"""
+    record = xp_records.get((guild_id, user_id))
+    if record is not None:
+        return record.as_dict() if record.last_message else None
+    return db.get_level(guild_id, user_id)
+
+def flush_xp_records(guild_id=None):
+    """Write buffered XP to storage and drop records whose cooldown has passed"""
+    for key in [key for key in xp_dirty if guild_id is None or key[0] == guild_id]:
+        xp_dirty.discard(key)
+        record = xp_records.get(key)
+        if record is not None:
+            db.set_level(key[0], key[1], record.as_dict())
+    
+    now = time.monotonic()
+    for key, record in list(xp_records.items()):
+        if key not in xp_dirty and (record.next_grant <= now or key[0] == guild_id):
+            del xp_records[key]
+
 async def process_leveling(message):
     """Process user leveling system"""
     if not message.guild:
         return
     
-    user_id = str(message.author.id)
-    guild_id = str(message.guild.id)
+    record = get_xp_record(message.guild.id, message.author.id)
     
-    user_levels = load_json('user_levels.json')
-    key = f"{guild_id}_{user_id}"
-    
-    now = datetime.now().isoformat()
-    
-    if key in user_levels:
-        user_data = user_levels[key]
-        last_message = datetime.fromisoformat(user_data.get('last_message', now))
-        
-        # Only give XP if 60 seconds have passed since last message
-        if (datetime.now() - last_message).total_seconds() >= 60:
-            user_data['xp'] = user_data.get('xp', 0) + 15
-            new_level = user_data['xp'] // 100
-            old_level = user_data.get('level', 0)
-            user_data['level'] = new_level
-            user_data['last_message'] = now
-            
-            # Check if leveled up
-            if new_level > old_level:
-                await handle_level_up(message, new_level)
-    else:
-        user_levels[key] = {
-            'xp': 15,
-            'level': 0,
-            'last_message': now
-        }
+    # Only give XP if the cooldown since the last rewarded message has passed
+    now = time.monotonic()
+    if now < record.next_grant:
+        return
     
-    save_json('user_levels.json', user_levels)
+    record.xp += XP_PER_MESSAGE
+    record.last_message = time.time()
+    record.next_grant = now + XP_COOLDOWN_SECONDS
+    xp_dirty.add((message.guild.id, message.author.id))
+    update_leaderboard(message.guild.id, message.author.id, record.xp)
+    
+    # Check if leveled up
+    new_level = record.xp // 100
+    if new_level > record.level:
+        record.level = new_level
+        queue_level_role_check(message.guild.id, message.author.id)
+        await handle_level_up(message, new_level)
 
 async def handle_level_up(message, new_level):
     """Handle level up notification and role assignment"""
-    guild_id = str(message.guild.id)
     user_id = message.author.id
     
-    guild_config = load_json('guild_config.json')
-    config = guild_config.get(guild_id, {})
+    config = get_guild_config(message.guild.id)
     
     # Send level up message
-    if config.get('leveling_channel'):
-        channel = bot.get_channel(config['leveling_channel'])
+    if config.leveling_channel:
+        channel = bot.get_channel(config.leveling_channel)
         if channel:
-            await channel.send(
+            enqueue_action(PRIORITY_ANNOUNCE, f"send:{channel.id}", lambda: channel.send(
                 f"**Thanks For Showing Your Activity <@{user_id}>! You just Stumbled Up To Level **{new_level}**. Keep GOING!!!!!** <:abilities:1402690411759407185>"
-            )
+            ))
     
     # Check for level roles
-    level_roles = load_json('level_roles.json')
-    guild_roles = level_roles.get(guild_id, {})
+    guild_roles = guild_data(message.guild.id, 'level_roles')
     
     if str(new_level) in guild_roles:
-        for role_id in guild_roles[str(new_level)]:
-            role = message.guild.get_role(int(role_id))
-            if role:
-                try:
-                    await message.author.add_roles(role)
-                except:
-                    pass
+        roles = [message.guild.get_role(int(role_id)) for role_id in guild_roles[str(new_level)]]
+        enqueue_action(
+            PRIORITY_ANNOUNCE, f"member:{message.guild.id}",
+            lambda: update_member_roles(message.author, add=[role for role in roles if role])
+        )
 
 async def process_automod(message):
     """Process automod checks"""
     if not message.guild or message.author.guild_permissions.manage_messages:
         return
     
-    guild_id = str(message.guild.id)
-    guild_config = load_json('guild_config.json')
-    config = guild_config.get(guild_id, {})
+    config = get_guild_config(message.guild.id)
     
-    if not config.get('automod_enabled'):
+    if not config.automod_enabled:
         return
     
-    spam_channels = config.get('spam_channels', '').split(',')
-    link_channels = config.get('link_channels', '').split(',')
-    
-    violations = []
-    
-    # Check spam (if not in spam channel)
-    if str(message.channel.id) not in spam_channels:
-        if await check_spam(message):
-            violations.append("spam")
+    violations = await run_automod_rules(message, config)
     
-    # Check emoji spam
-    if await check_emoji_spam(message):
-        violations.append("emoji spam")
-    
-    # Check bad words
-    if await check_bad_words(message.content):
-        violations.append("inappropriate language")
+    if violations:
+        await handle_automod_violation(message, violations, config.automod_log_channel, config.automod_log_digest)
+
+# Violations from one member in one channel within a short burst are handled together.
+# Cross-channel spam is one burst per member across the whole guild.
+AUTOMOD_BURST_SECONDS = 5
+AUTOMOD_BURST_MAX_SECONDS = 30
+# Violations whose earlier messages in the channel are part of the offence
+HISTORY_VIOLATIONS = ('spam', 'emoji spam')
+
+class AutomodBurst:
+    __slots__ = ('started', 'last_seen', 'pending_deletes', 'delete_queued')
+    
+    def __init__(self, now):
+        self.started = now
+        self.last_seen = now
+        # channel_id -> message ids waiting for that channel's bulk delete
+        self.pending_deletes = {}
+        self.delete_queued = set()
+
+# (channel_id or guild_id, author_id) -> AutomodBurst, least recently active first
+automod_bursts = OrderedDict()
+
+def delete_burst_messages(channel, burst, message_ids):
+    """Queue flagged messages for deletion, sharing one bulk delete per burst and channel"""
+    burst.pending_deletes.setdefault(channel.id, []).extend(message_ids)
+    if channel.id in burst.delete_queued:
+        return
+    burst.delete_queued.add(channel.id)
     
-    # Check links (if not in link channel)
-    if str(message.channel.id) not in link_channels:
-        if await check_links(message.content):
-            violations.append("unauthorized links")
+    async def delete():
+        burst.delete_queued.discard(channel.id)
+        message_ids = list(dict.fromkeys(burst.pending_deletes.pop(channel.id, [])))
+        for i in range(0, len(message_ids), 100):
+            await channel.delete_messages([discord.Object(id=message_id) for message_id in message_ids[i:i + 100]])
     
-    if violations:
-        await handle_automod_violation(message, violations, config.get('automod_log_channel'))
+    enqueue_action(PRIORITY_MODERATION, f"delete:{channel.id}", delete)
 
-async def handle_automod_violation(message, violations, log_channel_id):
+async def handle_automod_violation(message, violations, log_channel_id, digest=False):
     """Handle automod violations"""
-    user_id = str(message.author.id)
-    guild_id = str(message.guild.id)
+    now = time.monotonic()
+    # Copies of cross-channel spam land in other channels, so they share one burst guild-wide
+    scope = message.guild.id if "cross-channel spam" in violations else message.channel.id
+    key = (scope, message.author.id)
+    burst = automod_bursts.get(key)
+    
+    # Later messages of an ongoing burst are only deleted
+    if burst and now - burst.last_seen <= AUTOMOD_BURST_SECONDS and now - burst.started <= AUTOMOD_BURST_MAX_SECONDS:
+        burst.last_seen = now
+        automod_bursts.move_to_end(key)
+        delete_burst_messages(message.channel, burst, [message.id])
+        return
     
-    automod_warnings = load_json('automod_warnings.json')
-    key = f"{guild_id}_{user_id}"
+    burst = automod_bursts[key] = AutomodBurst(now)
+    automod_bursts.move_to_end(key)
+    while now - next(iter(automod_bursts.values())).last_seen > AUTOMOD_BURST_MAX_SECONDS:
+        automod_bursts.popitem(last=False)
+    
+    # Spam is made of the earlier messages too, so they go along with this one
+    message_ids = [message.id]
+    if any(violation in HISTORY_VIOLATIONS for violation in violations):
+        message_ids.extend(entry.message_id for entry in recent_author_messages(message))
+    
+    # Copies of cross-channel spam are removed from every channel they were posted in
+    if "cross-channel spam" in violations:
+        for channel_id, copy_ids in duplicate_copies(message).items():
+            if channel_id == message.channel.id:
+                message_ids.extend(copy_ids)
+                continue
+            channel = message.guild.get_channel_or_thread(channel_id)
+            if channel:
+                delete_burst_messages(channel, burst, copy_ids)
     
-    warning_count = automod_warnings.get(key, 0) + 1
-    automod_warnings[key] = warning_count
-    save_json('automod_warnings.json', automod_warnings)
+    warning_count = get_automod_count(message.guild.id, message.author.id) + 1
+    set_automod_count(message.guild.id, message.author.id, warning_count)
     
-    # Delete the violating message
-    try:
-        await message.delete()
-    except:
-        pass
+    # Delete the violating messages
+    delete_burst_messages(message.channel, burst, message_ids)
     
     # Send DM warning
-    try:
-        violation_text = ", ".join(violations)
-        await message.author.send(
-            f"Warning! Your message in **{message.guild.name}** was removed for: {violation_text}. "
-            f"This is warning {warning_count}/3. At 3 warnings, you will be temporarily muted."
-        )
-    except:
-        pass
+    violation_text = ", ".join(violations)
+    enqueue_action(PRIORITY_DM, f"dm:{message.author.id}", lambda: send_dm(
+        message.author,
+        f"Warning! Your message in **{message.guild.name}** was removed for: {violation_text}. "
+        f"This is warning {warning_count}/3. At 3 warnings, you will be temporarily muted."
+    ))
     
     # Log the violation
     if log_channel_id:
         log_channel = bot.get_channel(log_channel_id)
-        if log_channel:
+        if log_channel and digest and message.guild.id in automod_digests:
+            # A digest is being collected, this entry goes out with it
+            automod_digests[message.guild.id].append(
+                (message.author.id, ", ".join(violations), message.channel.id, warning_count)
+            )
+        elif log_channel:
+            if digest:
+                automod_digests[message.guild.id] = []
+                task = asyncio.create_task(send_automod_digests(message.guild.id, log_channel))
+                digest_tasks.add(task)
+                task.add_done_callback(digest_tasks.discard)
+            
             embed = discord.Embed(
                 title="Automod Violation",
                 color=0xff0000,
@@ -350,33 +1003,79 @@ async def handle_automod_violation(message, violations, log_channel_id):
             embed.add_field(name="Channel", value=f"{message.channel.mention}", inline=True)
             embed.add_field(name="Violations", value=", ".join(violations), inline=True)
             embed.add_field(name="Warning Count", value=f"{warning_count}/3", inline=True)
-            await log_channel.send(embed=embed)
+            enqueue_action(PRIORITY_LOG, f"send:{log_channel.id}", lambda: log_channel.send(embed=embed))
     
     # Auto-timeout at 3 warnings
     if warning_count >= 3:
+        enqueue_action(PRIORITY_MODERATION, f"member:{message.guild.id}", lambda: automod_timeout(message))
+
+# Automod log digests: the first entry is sent right away, the ones that follow are batched
+AUTOMOD_DIGEST_SECONDS = 5
+EMBED_MAX_FIELDS = 25
+EMBED_MAX_CHARS = 6000
+
+# guild_id -> list of (user_id, violations, channel_id, warning_count) waiting to be sent
+automod_digests = {}
+# Running digest tasks, kept so they are not garbage collected
+digest_tasks = set()
+
+def automod_digest_embeds(entries):
+    """Group digest entries by user and violation into embeds within Discord's field and size limits"""
+    groups = {}
+    for user_id, violations, channel_id, warning_count in entries:
+        group = groups.setdefault((user_id, violations), [0, {}, 0])
+        group[0] += 1
+        group[1][channel_id] = None
+        group[2] = warning_count
+    
+    embeds = []
+    for (user_id, violations), (count, channel_ids, warning_count) in groups.items():
+        channels = ", ".join(f"<#{channel_id}>" for channel_id in channel_ids)
+        name = f"{violations} x{count}"[:256]
+        value = f"<@{user_id}> in {channels}\nWarning Count: {warning_count}/3"[:1024]
+        if not embeds or len(embeds[-1].fields) >= EMBED_MAX_FIELDS or len(embeds[-1]) + len(name) + len(value) > EMBED_MAX_CHARS:
+            embeds.append(discord.Embed(
+                title=f"Automod Digest ({len(entries)} violations)",
+                color=0xff0000,
+                timestamp=datetime.now()
+            ))
+        embeds[-1].add_field(name=name, value=value, inline=False)
+    return embeds
+
+async def send_automod_digests(guild_id, log_channel):
+    """Send the entries collected for a guild every few seconds until it goes quiet"""
+    while True:
+        await asyncio.sleep(AUTOMOD_DIGEST_SECONDS)
+        entries = automod_digests.get(guild_id)
+        if not entries:
+            automod_digests.pop(guild_id, None)
+            return
+        automod_digests[guild_id] = []
+        for embed in automod_digest_embeds(entries):
+            enqueue_action(PRIORITY_LOG, f"send:{log_channel.id}", lambda embed=embed: log_channel.send(embed=embed))
+
+async def automod_timeout(message):
+    """Time out a member who reached 3 automod violations"""
+    try:
+        # Use Discord's built-in timeout (not custom implementation)
+        timeout_until = datetime.now() + timedelta(minutes=10)
+        await message.author.edit(timed_out_until=timeout_until, reason="Automod: 3 violations reached")
+        
+        # Reset warning count
+        set_automod_count(message.guild.id, message.author.id, 0)
+        
+        enqueue_action(PRIORITY_DM, f"dm:{message.author.id}", lambda: send_dm(
+            message.author,
+            f"You have been automatically timed out for 10 minutes in **{message.guild.name}** "
+            "for reaching 3 automod violations."
+        ))
+    except:
+        # Fallback to old timeout method if edit doesn't work
         try:
-            # Use Discord's built-in timeout (not custom implementation)
             timeout_until = datetime.now() + timedelta(minutes=10)
-            await message.author.edit(timed_out_until=timeout_until, reason="Automod: 3 violations reached")
-            
-            # Reset warning count
-            automod_warnings[key] = 0
-            save_json('automod_warnings.json', automod_warnings)
-            
-            try:
-                await message.author.send(
-                    f"You have been automatically timed out for 10 minutes in **{message.guild.name}** "
-                    "for reaching 3 automod violations."
-                )
-            except:
-                pass
+            await message.author.timeout(timeout_until, reason="Automod: 3 violations reached")
         except:
-            # Fallback to old timeout method if edit doesn't work
-            try:
-                timeout_until = datetime.now() + timedelta(minutes=10)
-                await message.author.timeout(timeout_until, reason="Automod: 3 violations reached")
-            except:
-                pass
+            pass
 
 # Moderation Commands
 @bot.command()
@@ -386,15 +1085,7 @@ async def warn(ctx, member: discord.Member, *, reason="No reason provided"):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    warnings = load_json('warnings.json')
-    warning = {
-        'user_id': member.id,
-        'guild_id': ctx.guild.id,
-        'reason': reason,
-        'timestamp': datetime.now().isoformat()
-    }
-    warnings.append(warning)
-    save_json('warnings.json', warnings)
+    db.add_warning(ctx.guild.id, member.id, reason, datetime.now().isoformat())
     
     embed = discord.Embed(
         title="User Warned",
@@ -413,8 +1104,7 @@ async def warn_hs(ctx, member: discord.Member):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    warnings = load_json('warnings.json')
-    user_warnings = [w for w in warnings if w['user_id'] == member.id and w['guild_id'] == ctx.guild.id]
+    user_warnings = db.get_warnings(ctx.guild.id, member.id)
     
     if not user_warnings:
         await ctx.send(f"{member.mention} has no warnings.")
@@ -443,22 +1133,13 @@ async def warn_rmv(ctx, member: discord.Member, number: int):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    warnings = load_json('warnings.json')
-    user_warnings = [w for w in warnings if w['user_id'] == member.id and w['guild_id'] == ctx.guild.id]
+    # Remove the specified number of most recent warnings
+    removed_count = db.remove_warnings(ctx.guild.id, member.id, number)
     
-    if not user_warnings:
+    if not removed_count:
         await ctx.send(f"{member.mention} has no warnings to remove.")
         return
     
-    # Remove the specified number of most recent warnings
-    removed_count = min(number, len(user_warnings))
-    user_warnings = user_warnings[:-removed_count]
-    
-    # Rebuild warnings list without the removed ones
-    new_warnings = [w for w in warnings if not (w['user_id'] == member.id and w['guild_id'] == ctx.guild.id)]
-    new_warnings.extend(user_warnings)
-    save_json('warnings.json', new_warnings)
-    
     await ctx.send(f"Removed {removed_count} warning(s) from {member.mention}.")
 
 @bot.command()
@@ -543,7 +1224,7 @@ async def ban(ctx, member: discord.Member, time_str: str = None, *, reason="No r
             duration = parse_time(time_str)
             if duration:
                 embed.add_field(name="Duration", value=time_str, inline=True)
-                asyncio.create_task(schedule_unban(ctx.guild, member, duration))
+                await schedule_timer('unban', ctx.guild.id, member.id, duration)
         
         await ctx.send(embed=embed)
         
@@ -552,13 +1233,148 @@ async def ban(ctx, member: discord.Member, time_str: str = None, *, reason="No r
     except Exception as e:
         await ctx.send(f"Error banning user: {str(e)}")
 
-async def schedule_unban(guild, member, duration):
-    """Schedule automatic unban"""
-    await asyncio.sleep(duration.total_seconds())
+# Timed moderation actions, kept as a heap of [due, id, action, guild_id, user_id, (attempts)] on disk
+timer_wakeup = asyncio.Event()
+timer_task = None
+
+def get_timers():
+    """Return the persisted timer state"""
+    state = load_json(TIMERS_PATH)
+    if 'timers' not in state:
+        state['timers'] = []
+        state['next_id'] = 1
+    return state
+
+async def schedule_timer(action, guild_id, user_id, duration):
+    """Persist a timed action and wake the dispatcher if it is now the earliest"""
+    state = get_timers()
+    heapq.heappush(state['timers'], [time.time() + duration.total_seconds(), state['next_id'], action, guild_id, user_id])
+    state['next_id'] += 1
+    await save_json_async(TIMERS_PATH, state)
+    timer_wakeup.set()
+
+async def timer_unban(guild, user_id):
+    """Lift a temporary ban"""
+    await guild.unban(discord.Object(id=user_id), reason="Temporary ban expired")
+
+TIMER_ACTIONS = {
+    'unban': timer_unban,
+}
+
+# Failed timers are retried after TIMER_RETRY_DELAY seconds, doubling up to TIMER_MAX_RETRY_DELAY
+TIMER_RETRY_DELAY = 30
+TIMER_MAX_RETRY_DELAY = 3600
+
+async def run_timer(entry):
+    """Run one due timer and return whether it is finished"""
+    _, timer_id, action, guild_id, user_id = entry[:5]
+    handler = TIMER_ACTIONS.get(action)
+    if handler is None:
+        print(f"Dropping timer {timer_id}: unknown action {action}")
+        return True
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        print(f"Timer {timer_id}: guild {guild_id} not available, retrying later")
+        return False
     try:
-        await guild.unban(member, reason="Temporary ban expired")
-    except:
+        await handler(guild, user_id)
+    except discord.NotFound:
+        # Nothing left to undo
         pass
+    except Exception as e:
+        print(f"Error running timer {timer_id} ({action}): {e}")
+        return False
+    return True
+
+async def run_timers():
+    """Run every timed action from one task, sleeping until the next is due"""
+    state = get_timers()
+    heapq.heapify(state['timers'])
+    while True:
+        timer_wakeup.clear()
+        timers = state['timers']
+        
+        # Due timers stay stored until they have run, so a crash or error never loses one
+        now = time.time()
+        due = sorted(entry for entry in timers if entry[0] <= now)
+        if due:
+            finished = set()
+            for entry in due:
+                if await run_timer(entry):
+                    finished.add(entry[1])
+                else:
+                    attempts = entry[5] if len(entry) > 5 else 0
+                    entry[0] = time.time() + min(TIMER_RETRY_DELAY * 2 ** attempts, TIMER_MAX_RETRY_DELAY)
+                    entry[5:] = [attempts + 1]
+            timers[:] = [entry for entry in timers if entry[1] not in finished]
+            heapq.heapify(timers)
+            await save_json_async(TIMERS_PATH, state)
+            continue
+        
+        # Sleep until the earliest timer, waking early if a sooner one is added
+        delay = min(timers[0][0] - time.time(), 3600) if timers else None
+        try:
+            await asyncio.wait_for(timer_wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+# Banned users per guild, looked up by id, lowercased name or full tag
+class BanIndex:
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+        self.by_tag = {}
+        self.loading = None
+    
+    async def load(self, guild):
+        """Page through the guild's ban list once"""
+        async for entry in guild.bans(limit=None):
+            self.add(entry.user)
+    
+    def add(self, user):
+        self.by_id[str(user.id)] = user
+        self.by_name[user.name.lower()] = user
+        self.by_tag[str(user)] = user
+    
+    def remove(self, user):
+        user = self.by_id.pop(str(user.id), user)
+        if self.by_name.get(user.name.lower()) is user:
+            del self.by_name[user.name.lower()]
+        if self.by_tag.get(str(user)) is user:
+            del self.by_tag[str(user)]
+    
+    def find(self, query):
+        return self.by_id.get(query) or self.by_tag.get(query) or self.by_name.get(query.lower())
+
+ban_indexes = {}
+
+async def get_ban_index(guild):
+    """Return the guild's ban index, loading the ban list on first use"""
+    index = ban_indexes.get(guild.id)
+    if index is None:
+        # Register before loading so ban events during the load are not lost
+        index = ban_indexes[guild.id] = BanIndex()
+        index.loading = asyncio.create_task(index.load(guild))
+    try:
+        await index.loading
+    except:
+        ban_indexes.pop(guild.id, None)
+        raise
+    return index
+
+@bot.event
+async def on_member_ban(guild, user):
+    """Keep a loaded ban index current"""
+    index = ban_indexes.get(guild.id)
+    if index is not None:
+        index.add(user)
+
+@bot.event
+async def on_member_unban(guild, user):
+    """Keep a loaded ban index current"""
+    index = ban_indexes.get(guild.id)
+    if index is not None:
+        index.remove(user)
 
 @bot.command()
 async def unban(ctx, *, member_name):
@@ -567,20 +1383,22 @@ async def unban(ctx, *, member_name):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    banned_users = [entry async for entry in ctx.guild.bans()]
+    index = await get_ban_index(ctx.guild)
+    user = index.find(member_name)
     
-    for ban_entry in banned_users:
-        user = ban_entry.user
-        if user.name.lower() == member_name.lower() or str(user) == member_name:
-            try:
-                await ctx.guild.unban(user, reason=f"Unbanned by {ctx.author.name}")
-                await ctx.send(f"{user} has been unbanned.")
-                return
-            except Exception as e:
-                await ctx.send(f"Error unbanning user: {str(e)}")
-                return
+    if user is None:
+        await ctx.send(f"User '{member_name}' not found in ban list.")
+        return
     
-    await ctx.send(f"User '{member_name}' not found in ban list.")
+    try:
+        await ctx.guild.unban(user, reason=f"Unbanned by {ctx.author.name}")
+        index.remove(user)
+        await ctx.send(f"{user} has been unbanned.")
+    except discord.NotFound:
+        index.remove(user)
+        await ctx.send(f"User '{member_name}' not found in ban list.")
+    except Exception as e:
+        await ctx.send(f"Error unbanning user: {str(e)}")
 
 @bot.command()
 async def kick(ctx, member: discord.Member, *, reason="No reason provided"):
@@ -607,6 +1425,142 @@ async def kick(ctx, member: discord.Member, *, reason="No reason provided"):
     except Exception as e:
         await ctx.send(f"Error kicking user: {str(e)}")
 
+# Bulk moderation, for cleaning up raids in one command
+BULK_CONCURRENCY = 5
+BULK_MAX_MEMBERS = 500
+
+def is_bulk_join_target(ctx, member):
+    """Check if a recent joiner may be swept up by joined:<time>, skipping bots, staff and higher ranks"""
+    if member.bot or member.guild_permissions.manage_messages:
+        return False
+    return ctx.author == ctx.guild.owner or member.top_role < ctx.author.top_role
+
+def bulk_targets(ctx, members, reason):
+    """Return the targeted members and reason, adding recent joins for a joined:<time> reason"""
+    targets = list(members)
+    first, _, rest = reason.partition(' ')
+    if first.lower().startswith('joined:'):
+        duration = parse_time(first[7:])
+        if duration:
+            since = discord.utils.utcnow() - duration
+            targets.extend(m for m in ctx.guild.members if m.joined_at and m.joined_at >= since and is_bulk_join_target(ctx, m))
+            reason = rest.strip() or "No reason provided"
+    
+    targets = [m for m in dict.fromkeys(targets) if m != ctx.author and m != ctx.guild.me]
+    return targets, reason
+
+async def check_bulk_targets(ctx, members):
+    """Tell the moderator if a bulk command has no members or too many"""
+    if not members:
+        await ctx.send("No members to act on. Mention members or start the reason with `joined:<time>`.")
+        return False
+    if len(members) > BULK_MAX_MEMBERS:
+        await ctx.send(f"That is {len(members)} members, the limit is {BULK_MAX_MEMBERS} per command.")
+        return False
+    return True
+
+async def run_bulk_action(ctx, title, members, reason, action):
+    """Run an action on many members a few at a time and post one summary"""
+    if not await check_bulk_targets(ctx, members):
+        return
+    
+    status = await ctx.send(f"Working on {len(members)} members...")
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    
+    async def run(member):
+        async with semaphore:
+            try:
+                await action(member)
+                return True
+            except:
+                return False
+    
+    results = await asyncio.gather(*(run(member) for member in members))
+    await send_bulk_summary(ctx, status, title, members, results, reason)
+
+async def send_bulk_summary(ctx, status, title, members, results, reason):
+    """Replace the status message with a summary embed"""
+    done = [member for member, ok in zip(members, results) if ok]
+    failed = [member for member, ok in zip(members, results) if not ok]
+    
+    embed = discord.Embed(title=title, color=0xff0000, timestamp=datetime.now())
+    embed.add_field(name="Succeeded", value=len(done), inline=True)
+    embed.add_field(name="Failed", value=len(failed), inline=True)
+    embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
+    embed.add_field(name="Reason", value=reason[:1024], inline=False)
+    if done:
+        names = ', '.join(str(member) for member in done)
+        embed.add_field(name="Members", value=names if len(names) <= 1024 else names[:1020] + '...', inline=False)
+    if failed:
+        names = ', '.join(str(member) for member in failed)
+        embed.add_field(name="Could not act on", value=names if len(names) <= 1024 else names[:1020] + '...', inline=False)
+    
+    await status.edit(content=None, embed=embed)
+
+@bot.command()
+async def masswarn(ctx, members: commands.Greedy[discord.Member], *, reason="No reason provided"):
+    """Warn many users at once"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    members, reason = bulk_targets(ctx, members, reason)
+    if not await check_bulk_targets(ctx, members):
+        return
+    
+    # Every warning goes to storage in one batch
+    db.add_warnings(ctx.guild.id, [member.id for member in members], reason, datetime.now().isoformat())
+    status = await ctx.send(f"Warned {len(members)} members.")
+    await send_bulk_summary(ctx, status, "Users Warned", members, [True] * len(members), reason)
+
+@bot.command()
+async def masskick(ctx, members: commands.Greedy[discord.Member], *, reason="No reason provided"):
+    """Kick many users at once"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    members, reason = bulk_targets(ctx, members, reason)
+    await run_bulk_action(
+        ctx, "Users Kicked", members, reason,
+        lambda member: member.kick(reason=f"Kicked by {ctx.author.name}: {reason}")
+    )
+
+@bot.command()
+async def massban(ctx, members: commands.Greedy[discord.Member], *, reason="No reason provided"):
+    """Ban many users at once"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    members, reason = bulk_targets(ctx, members, reason)
+    await run_bulk_action(
+        ctx, "Users Banned", members, reason,
+        lambda member: member.ban(reason=f"Banned by {ctx.author.name}: {reason}")
+    )
+
+@bot.command()
+async def massmute(ctx, time_str: str, members: commands.Greedy[discord.Member], *, reason="No reason provided"):
+    """Mute many users at once for a specified time (1m to 7d)"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    duration = parse_time(time_str)
+    if not duration:
+        await ctx.send("Invalid time format. Use m (minutes), h (hours), d (days).")
+        return
+    
+    if duration < timedelta(minutes=1) or duration > timedelta(days=7):
+        await ctx.send("Mute duration must be between 1 minute and 7 days.")
+        return
+    
+    members, reason = bulk_targets(ctx, members, reason)
+    await run_bulk_action(
+        ctx, "Users Muted", members, reason,
+        lambda member: member.timeout(duration, reason=f"Muted by {ctx.author.name}: {reason}")
+    )
+
 # Configuration Commands
 @bot.command()
 async def welcomer_enable(ctx, channel: discord.TextChannel):
@@ -615,15 +1569,10 @@ async def welcomer_enable(ctx, channel: discord.TextChannel):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['welcomer_enabled'] = True
-    guild_config[guild_id]['welcomer_channel'] = channel.id
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['welcomer_enabled'] = True
+    config['welcomer_channel'] = channel.id
+    await save_guild_config(ctx.guild.id)
     
     await ctx.send(f"Welcomer system has been enabled! Welcome messages will be sent to {channel.mention}.")
 
@@ -634,14 +1583,9 @@ async def automod_enable(ctx):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['automod_enabled'] = True
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['automod_enabled'] = True
+    await save_guild_config(ctx.guild.id)
     
     await ctx.send("Automod has been enabled for this server.")
 
@@ -652,16 +1596,141 @@ async def automod_log(ctx, channel: discord.TextChannel):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
+    config = guild_data(ctx.guild.id, 'config')
+    config['automod_log_channel'] = channel.id
+    await save_guild_config(ctx.guild.id)
+    
+    await ctx.send(f"Automod log channel set to {channel.mention}.")
+
+@bot.command()
+async def automod_digest(ctx, state: str):
+    """Batch automod log entries into digests during busy periods"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
     
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
+    if state.lower() not in ('on', 'off'):
+        await ctx.send("Usage: `!automod_digest <on|off>`")
+        return
     
-    guild_config[guild_id]['automod_log_channel'] = channel.id
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['automod_log_digest'] = state.lower() == 'on'
+    await save_guild_config(ctx.guild.id)
     
-    await ctx.send(f"Automod log channel set to {channel.mention}.")
+    await ctx.send(f"Automod log digests are now **{state.lower()}**.")
+
+@bot.command()
+async def badwords(ctx, action=None, *words):
+    """Show or edit the automod bad words list"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    config = guild_data(ctx.guild.id, 'config')
+    current = config.get('bad_words', BAD_WORDS)
+    action = (action or 'list').lower()
+    words = [w.lower() for w in words]
+    
+    if action == 'add':
+        config['bad_words'] = current + [w for w in dict.fromkeys(words) if w not in current]
+    elif action == 'remove':
+        config['bad_words'] = [w for w in current if w not in words]
+    elif action == 'reset':
+        config.pop('bad_words', None)
+    elif action == 'list':
+        word_list = ', '.join(f"`{w}`" for w in current)
+        if len(word_list) > 1900:
+            word_list = word_list[:1900] + "..."
+        await ctx.send(f"**Bad words ({len(current)}):** {word_list or 'none'}")
+        return
+    else:
+        await ctx.send("Usage: `!badwords [add|remove|reset] [words...]`")
+        return
+    
+    await save_guild_config(ctx.guild.id)
+    await ctx.send(f"Bad words list updated ({len(config.get('bad_words', BAD_WORDS))} words).")
+
+@bot.command()
+async def automod_rule(ctx, rule_name: str, state: str):
+    """Turn a single automod rule on or off for the server"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    rule_names = [rule.name for rule in AUTOMOD_RULES]
+    rule_name = rule_name.lower()
+    if rule_name not in rule_names or state.lower() not in ('on', 'off'):
+        await ctx.send(f"Usage: `!automod_rule <{'|'.join(rule_names)}> <on|off>`")
+        return
+    
+    config = guild_data(ctx.guild.id, 'config')
+    disabled = [name for name in config.get('automod_disabled_rules', []) if name != rule_name]
+    enabled = [name for name in config.get('automod_enabled_rules', []) if name != rule_name]
+    if state.lower() == 'off':
+        disabled.append(rule_name)
+    else:
+        enabled.append(rule_name)
+    config['automod_disabled_rules'] = disabled
+    config['automod_enabled_rules'] = enabled
+    await save_guild_config(ctx.guild.id)
+    
+    await ctx.send(f"Automod rule `{rule_name}` is now **{state.lower()}**.")
+
+@bot.command()
+async def raid_protection(ctx, threshold: str, action: str = 'alert'):
+    """Set how many joins within the join window count as a raid, and what to do about it"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    config = guild_data(ctx.guild.id, 'config')
+    
+    if threshold.lower() == 'off':
+        config['raid_threshold'] = 0
+        await save_guild_config(ctx.guild.id)
+        await ctx.send("Raid protection disabled.")
+        return
+    
+    action = action.lower()
+    if not threshold.isdigit() or int(threshold) < 2 or action not in RAID_ACTIONS:
+        await ctx.send(f"Usage: `!raid_protection <joins|off> [{'|'.join(RAID_ACTIONS)}]`")
+        return
+    
+    config['raid_threshold'] = int(threshold)
+    config['raid_action'] = action
+    await save_guild_config(ctx.guild.id)
+    
+    await ctx.send(f"Raid protection enabled: **{action}** when {threshold} members join within {JOIN_WINDOW_SECONDS} seconds.")
+
+@bot.command()
+async def automod_stats(ctx):
+    """Show how often each automod rule runs, hits and how long it takes"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    disabled = get_guild_config(ctx.guild.id).disabled_rules
+    
+    embed = discord.Embed(
+        title="Automod Rule Stats",
+        color=0x0099ff,
+        timestamp=datetime.now()
+    )
+    for rule in AUTOMOD_RULES:
+        avg_ms = rule.total_time / rule.runs * 1000 if rule.runs else 0
+        status = "off" if rule.name in disabled else "on"
+        embed.add_field(
+            name=f"{rule.name} ({status})",
+            value=f"**Cost:** {rule.cost}\n**Runs:** {rule.runs}\n**Hits:** {rule.hits}\n**Avg:** {avg_ms:.3f} ms",
+            inline=True
+        )
+    embed.add_field(
+        name="Warning DMs",
+        value=f"**Sent:** {dm_stats['sent']}\n**Failed:** {dm_stats['failed']}\n**Skipped (DMs closed):** {dm_stats['skipped']}",
+        inline=True
+    )
+    embed.add_field(name="Dropped Actions", value=str(action_stats['dropped']), inline=True)
+    await ctx.send(embed=embed)
 
 @bot.command()
 async def spam(ctx, *channels: discord.TextChannel):
@@ -672,14 +1741,9 @@ async def spam(ctx, *channels: discord.TextChannel):
     
     channel_ids = ','.join(str(ch.id) for ch in channels)
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['spam_channels'] = channel_ids
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['spam_channels'] = channel_ids
+    await save_guild_config(ctx.guild.id)
     
     channel_mentions = ', '.join(ch.mention for ch in channels)
     await ctx.send(f"Spam is now allowed in: {channel_mentions}")
@@ -693,14 +1757,9 @@ async def link(ctx, *channels: discord.TextChannel):
     
     channel_ids = ','.join(str(ch.id) for ch in channels)
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['link_channels'] = channel_ids
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['link_channels'] = channel_ids
+    await save_guild_config(ctx.guild.id)
     
     channel_mentions = ', '.join(ch.mention for ch in channels)
     await ctx.send(f"Links are now allowed in: {channel_mentions}")
@@ -713,14 +1772,9 @@ async def leveling_channel(ctx, channel: discord.TextChannel):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['leveling_channel'] = channel.id
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['leveling_channel'] = channel.id
+    await save_guild_config(ctx.guild.id)
     
     await ctx.send(f"Leveling announcements will be sent to {channel.mention}.")
 
@@ -731,11 +1785,7 @@ async def levelrole(ctx, action_or_role, role_or_level=None, level=None):
         await ctx.send("You don't have permission to use this command.")
         return
     
-    level_roles = load_json('level_roles.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in level_roles:
-        level_roles[guild_id] = {}
+    level_roles = guild_data(ctx.guild.id, 'level_roles')
     
     if action_or_role.lower() == 'elim':
         # Remove role: !levelrole elim @role
@@ -750,11 +1800,11 @@ async def levelrole(ctx, action_or_role, role_or_level=None, level=None):
             return
         
         # Remove role from all levels
-        for level_num in level_roles[guild_id]:
-            if str(role.id) in level_roles[guild_id][level_num]:
-                level_roles[guild_id][level_num].remove(str(role.id))
+        for level_num in level_roles:
+            if str(role.id) in level_roles[level_num]:
+                level_roles[level_num].remove(str(role.id))
         
-        save_json('level_roles.json', level_roles)
+        await save_guild_data_async(ctx.guild.id, 'level_roles')
         await ctx.send(f"Removed {role.mention} from level rewards.")
     
     else:
@@ -766,29 +1816,40 @@ async def levelrole(ctx, action_or_role, role_or_level=None, level=None):
             await ctx.send("Usage: `!levelrole @role <level>` or `!levelrole elim @role`")
             return
         
-        if str(target_level) not in level_roles[guild_id]:
-            level_roles[guild_id][str(target_level)] = []
+        if str(target_level) not in level_roles:
+            level_roles[str(target_level)] = []
         
-        if str(role.id) not in level_roles[guild_id][str(target_level)]:
-            level_roles[guild_id][str(target_level)].append(str(role.id))
+        if str(role.id) not in level_roles[str(target_level)]:
+            level_roles[str(target_level)].append(str(role.id))
         
-        save_json('level_roles.json', level_roles)
+        await save_guild_data_async(ctx.guild.id, 'level_roles')
+        
+        # Hand the new reward to members who already reached the level
+        start_level_role_sweep(ctx.guild.id)
         await ctx.send(f"Added {role.mention} as reward for reaching level {target_level}.")
 
+@bot.command()
+async def levelrole_sync(ctx):
+    """Re-check level roles for every member of the server"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    start_level_role_sweep(ctx.guild.id)
+    await ctx.send("Level roles will be re-checked for every member in the background.")
+
 @bot.command()
 async def level(ctx, member: discord.Member = None):
     """Check a user's level"""
     if member is None:
         member = ctx.author
     
-    user_levels = load_json('user_levels.json')
-    key = f"{ctx.guild.id}_{member.id}"
+    user_data = get_member_level(ctx.guild.id, member.id)
     
-    if key not in user_levels:
+    if not user_data:
         await ctx.send(f"{member.mention} is not in the leveling system yet.")
         return
     
-    user_data = user_levels[key]
     xp = user_data.get('xp', 0)
     level = user_data.get('level', 0)
     xp_for_next = (level + 1) * 100
@@ -801,10 +1862,66 @@ async def level(ctx, member: discord.Member = None):
     embed.add_field(name="Current Level", value=level, inline=True)
     embed.add_field(name="Total XP", value=xp, inline=True)
     embed.add_field(name="XP to Next Level", value=xp_needed, inline=True)
+    
+    board = get_leaderboard(ctx.guild.id)
+    rank = board.rank(member.id)
+    if rank:
+        embed.add_field(name="Rank", value=f"#{rank} of {len(board)}", inline=True)
+    
     embed.set_thumbnail(url=member.display_avatar.url)
     
     await ctx.send(embed=embed)
 
+LEADERBOARD_PAGE_SIZE = 10
+
+def leaderboard_embed(guild, page):
+    """Build the embed for one page of a guild's leaderboard"""
+    board = get_leaderboard(guild.id)
+    pages = max(1, -(-len(board) // LEADERBOARD_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    
+    lines = [
+        f"**#{rank}** <@{user_id}> - Level {xp // 100} ({xp} XP)"
+        for rank, user_id, xp in board.top((page - 1) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE)
+    ]
+    
+    embed = discord.Embed(
+        title=f"🏆 {guild.name} Leaderboard",
+        description="\n".join(lines) or "Nobody has earned XP yet.",
+        color=0xffd700
+    )
+    embed.set_footer(text=f"Page {page}/{pages}")
+    return embed, page, pages
+
+class LeaderboardView(discord.ui.View):
+    def __init__(self, author_id, page):
+        super().__init__(timeout=120)
+        self.author_id = author_id
+        self.page = page
+    
+    async def show_page(self, interaction: discord.Interaction, page):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Use `!leaderboard` to browse it yourself.", ephemeral=True)
+            return
+        
+        embed, self.page, _ = leaderboard_embed(interaction.guild, page)
+        await interaction.response.edit_message(embed=embed, view=self)
+    
+    @discord.ui.button(label='◀', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+    
+    @discord.ui.button(label='▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+@bot.command()
+async def leaderboard(ctx, page: int = 1):
+    """Show the server's XP leaderboard"""
+    embed, page, pages = leaderboard_embed(ctx.guild, page)
+    view = LeaderboardView(ctx.author.id, page) if pages > 1 else None
+    await ctx.send(embed=embed, view=view)
+
 @bot.command()
 async def lock(ctx, *, args=None):
     """Lock a channel, optionally allowing specific roles"""
@@ -878,6 +1995,133 @@ async def unlock(ctx):
     except Exception as e:
         await ctx.send(f"Error unlocking channel: {str(e)}")
 
+# Server-wide lockdown, saving each channel's overwrites so they can be restored exactly
+LOCKDOWN_CONCURRENCY = 5
+
+def snapshot_overwrites(channel):
+    """Return a channel's overwrites as [target_id, type, allow, deny] entries"""
+    snapshot = []
+    for target, overwrite in channel.overwrites.items():
+        allow, deny = overwrite.pair()
+        # Uncached targets come back as discord.Object with the real type attached
+        kind = 'role' if issubclass(getattr(target, 'type', type(target)), discord.Role) else 'member'
+        snapshot.append([target.id, kind, allow.value, deny.value])
+    return snapshot
+
+def restore_overwrites(snapshot):
+    """Turn a saved snapshot back into an overwrites mapping"""
+    return {
+        discord.Object(id=target_id, type=discord.Role if kind == 'role' else discord.Member):
+            discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+        for target_id, kind, allow, deny in snapshot
+    }
+
+async def edit_channels(channels, build_overwrites, reason):
+    """Apply one overwrites edit per channel, a few channels at a time"""
+    semaphore = asyncio.Semaphore(LOCKDOWN_CONCURRENCY)
+    
+    async def edit(channel):
+        async with semaphore:
+            try:
+                await channel.edit(overwrites=build_overwrites(channel), reason=reason)
+                return True
+            except:
+                return False
+    
+    return await asyncio.gather(*(edit(channel) for channel in channels))
+
+@bot.command()
+async def lockdown(ctx, *, args=None):
+    """Lock every channel in the server, optionally allowing specific roles"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    snapshots = guild_data(ctx.guild.id, 'lockdown')
+    everyone_role = ctx.guild.default_role
+    mentioned_roles = ctx.message.role_mentions
+    
+    # Channels that are already locked down keep their original snapshot
+    channels = [
+        channel for channel in ctx.guild.channels
+        if not isinstance(channel, discord.CategoryChannel) and str(channel.id) not in snapshots
+    ]
+    if not channels:
+        await ctx.send("The server is already locked down.")
+        return
+    
+    # Save every snapshot before touching a channel
+    for channel in channels:
+        snapshots[str(channel.id)] = snapshot_overwrites(channel)
+    await save_guild_data_async(ctx.guild.id, 'lockdown')
+    
+    def locked_overwrites(channel):
+        overwrites = {
+            target: discord.PermissionOverwrite.from_pair(*overwrite.pair())
+            for target, overwrite in channel.overwrites.items()
+        }
+        overwrites.setdefault(everyone_role, discord.PermissionOverwrite()).update(
+            send_messages=False, send_messages_in_threads=False, add_reactions=False
+        )
+        for role in mentioned_roles:
+            overwrites.setdefault(role, discord.PermissionOverwrite()).update(
+                send_messages=True, send_messages_in_threads=True
+            )
+        return overwrites
+    
+    status = await ctx.send(f"🔒 Locking {len(channels)} channels...")
+    results = await edit_channels(channels, locked_overwrites, f"Lockdown by {ctx.author.name}")
+    
+    # Channels we could not lock have nothing to restore
+    for channel, locked in zip(channels, results):
+        if not locked:
+            del snapshots[str(channel.id)]
+    await save_guild_data_async(ctx.guild.id, 'lockdown')
+    
+    message = f"🔒 Server locked down! {results.count(True)} channels locked."
+    if mentioned_roles:
+        message += f" Only {', '.join(role.mention for role in mentioned_roles)} can send messages."
+    if not all(results):
+        message += f" {results.count(False)} channels could not be locked."
+    await status.edit(content=message)
+
+@bot.command()
+async def unlockdown(ctx):
+    """Restore every channel to how it was before the lockdown"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    snapshots = guild_data(ctx.guild.id, 'lockdown')
+    if not snapshots:
+        await ctx.send("The server is not locked down.")
+        return
+    
+    # Forget snapshots of channels that have since been deleted
+    channels = []
+    for channel_id in list(snapshots):
+        channel = ctx.guild.get_channel(int(channel_id))
+        if channel:
+            channels.append(channel)
+        else:
+            del snapshots[channel_id]
+    
+    status = await ctx.send(f"🔓 Restoring {len(channels)} channels...")
+    results = await edit_channels(
+        channels, lambda channel: restore_overwrites(snapshots[str(channel.id)]), f"Lockdown lifted by {ctx.author.name}"
+    )
+    
+    # Keep the snapshots of channels that failed so the command can be retried
+    for channel, restored in zip(channels, results):
+        if restored:
+            del snapshots[str(channel.id)]
+    await save_guild_data_async(ctx.guild.id, 'lockdown')
+    
+    message = f"🔓 Lockdown lifted! {results.count(True)} channels restored."
+    if not all(results):
+        message += f" {results.count(False)} channels could not be restored, run `!unlockdown` again."
+    await status.edit(content=message)
+
 # Account linking system
 class IGNModal(discord.ui.Modal, title='Link Your Account'):
     def __init__(self):
@@ -891,26 +2135,20 @@ class IGNModal(discord.ui.Modal, title='Link Your Account'):
     )
     
     async def on_submit(self, interaction: discord.Interaction):
-        user_accounts = load_json('user_accounts.json')
-        key = f"{interaction.guild.id}_{interaction.user.id}"
-        
-        user_accounts[key] = {
+        db.set_account(interaction.guild.id, interaction.user.id, {
             'ign': self.ign.value,
             'linked_at': datetime.now().isoformat()
-        }
-        save_json('user_accounts.json', user_accounts)
+        })
         
         # Try to give verified role
-        guild_config = load_json('guild_config.json')
-        config = guild_config.get(str(interaction.guild.id), {})
-        verified_role_id = config.get('verified_role')
+        verified_role_id = get_guild_config(interaction.guild.id).verified_role
         
         role_text = ""
         if verified_role_id:
-            verified_role = interaction.guild.get_role(int(verified_role_id))
+            verified_role = interaction.guild.get_role(verified_role_id)
             if verified_role:
                 try:
-                    await interaction.user.add_roles(verified_role, reason="Account linked")
+                    await update_member_roles(interaction.user, add=[verified_role], reason="Account linked")
                     role_text = f"\n🎉 You've been given the {verified_role.mention} role!"
                 except:
                     pass
@@ -931,6 +2169,10 @@ class AccountLinkView(discord.ui.View):
         await interaction.response.send_modal(IGNModal())
 
 # Ticket system
+
+# (guild_id, user_id) pairs whose ticket channel is being created right now
+tickets_in_progress = set()
+
 class TicketView(discord.ui.View):
     def __init__(self, ticket_types):
         super().__init__(timeout=None)
@@ -979,12 +2221,30 @@ class TicketView(discord.ui.View):
         guild = interaction.guild
         user = interaction.user
         
+        # Ignore repeated clicks while the first one is still creating the channel
+        key = (guild.id, user.id)
+        if key in tickets_in_progress:
+            await interaction.response.send_message(
+                "Your ticket is already being created, please wait a moment.",
+                ephemeral=True
+            )
+            return
+        
+        tickets_in_progress.add(key)
+        try:
+            await self._create_ticket(interaction, ticket_type)
+        finally:
+            tickets_in_progress.discard(key)
+    
+    async def _create_ticket(self, interaction: discord.Interaction, ticket_type):
+        guild = interaction.guild
+        user = interaction.user
+        
         # Check if user already has an open ticket
-        tickets = load_json('tickets.json')
-        user_tickets = [t for t in tickets if t['user_id'] == user.id and t['guild_id'] == guild.id and not t.get('closed', False)]
+        open_ticket = db.get_open_ticket(guild.id, user.id)
         
-        if user_tickets:
-            channel = guild.get_channel(user_tickets[0]['channel_id'])
+        if open_ticket:
+            channel = guild.get_channel(open_ticket['channel_id'])
             if channel:
                 await interaction.response.send_message(
                     f"You already have an open ticket: {channel.mention}",
@@ -1001,16 +2261,10 @@ class TicketView(discord.ui.View):
         }
         
         # Add staff roles to overwrites
-        guild_config = load_json('guild_config.json')
-        config = guild_config.get(str(guild.id), {})
-        staff_roles = config.get('staff_roles', '')
-        
-        if staff_roles:
-            staff_role_ids = staff_roles.split(',')
-            for role_id in staff_role_ids:
-                role = guild.get_role(int(role_id))
-                if role:
-                    overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+        for role_id in get_guild_config(guild.id).staff_roles:
+            role = guild.get_role(role_id)
+            if role:
+                overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
         
         try:
             ticket_channel = await guild.create_text_channel(
@@ -1027,8 +2281,7 @@ class TicketView(discord.ui.View):
                 'created_at': datetime.now().isoformat(),
                 'closed': False
             }
-            tickets.append(ticket)
-            save_json('tickets.json', tickets)
+            db.add_ticket(ticket)
             
             # Send welcome message in ticket
             embed = discord.Embed(
@@ -1072,14 +2325,12 @@ async def IGN(ctx, member: discord.Member = None):
     if member is None:
         member = ctx.author
     
-    user_accounts = load_json('user_accounts.json')
-    key = f"{ctx.guild.id}_{member.id}"
+    account_data = db.get_account(ctx.guild.id, member.id)
     
-    if key not in user_accounts:
+    if not account_data:
         await ctx.send(f"{member.mention} hasn't linked their account yet.")
         return
     
-    account_data = user_accounts[key]
     ign = account_data['ign']
     linked_at = account_data['linked_at']
     
@@ -1129,14 +2380,9 @@ async def spu(ctx, *roles: discord.Role):
     
     role_ids = ','.join(str(role.id) for role in roles)
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['staff_roles'] = role_ids
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['staff_roles'] = role_ids
+    await save_guild_config(ctx.guild.id)
     
     role_mentions = ', '.join(role.mention for role in roles)
     await ctx.send(f"Staff roles updated! These roles can now use ALL bot commands: {role_mentions}")
@@ -1148,14 +2394,9 @@ async def verified_role(ctx, role: discord.Role):
         await ctx.send("You need administrator permission to use this command.")
         return
     
-    guild_config = load_json('guild_config.json')
-    guild_id = str(ctx.guild.id)
-    
-    if guild_id not in guild_config:
-        guild_config[guild_id] = {}
-    
-    guild_config[guild_id]['verified_role'] = role.id
-    save_json('guild_config.json', guild_config)
+    config = guild_data(ctx.guild.id, 'config')
+    config['verified_role'] = role.id
+    await save_guild_config(ctx.guild.id)
     
     await ctx.send(f"Verified role set to {role.mention}! Users will receive this role when they link their account.")
 
@@ -1167,21 +2408,14 @@ async def delete_ticket(ctx):
         return
     
     # Check if current channel is a ticket
-    tickets = load_json('tickets.json')
-    ticket = None
-    for t in tickets:
-        if t['channel_id'] == ctx.channel.id and not t.get('closed', False):
-            ticket = t
-            break
+    ticket = db.get_ticket_by_channel(ctx.guild.id, ctx.channel.id)
     
     if not ticket:
         await ctx.send("This is not a ticket channel.")
         return
     
     # Mark ticket as closed
-    ticket['closed'] = True
-    ticket['closed_at'] = datetime.now().isoformat()
-    save_json('tickets.json', tickets)
+    db.close_ticket(ctx.guild.id, ctx.channel.id, datetime.now().isoformat())
     
     await ctx.send("This ticket will be deleted in 5 seconds...")
     await asyncio.sleep(5)
@@ -1219,6 +2453,132 @@ async def delete(ctx, number: int):
     except Exception as e:
         await ctx.send(f"Error deleting messages: {str(e)}")
 
+# Streaming purge: bulk delete for recent messages, paced single deletes for older ones
+PURGE_MAX = 10000
+PURGE_SCAN_LIMIT = 20000
+PURGE_SINGLE_DELETE_DELAY = 1.0
+PURGE_STATUS_INTERVAL = 3
+# Discord only bulk deletes messages younger than 14 days, keep a margin for clock skew
+PURGE_BULK_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+def parse_purge_filters(ctx, filters):
+    """Turn purge filter arguments into a message predicate and a time cutoff"""
+    authors = {member.id for member in ctx.message.mentions}
+    pattern = None
+    links = attachments = False
+    since = None
+    
+    for arg in filters:
+        lowered = arg.lower()
+        if arg.startswith('<@'):
+            continue
+        elif lowered == 'links':
+            links = True
+        elif lowered == 'attachments':
+            attachments = True
+        elif lowered.startswith('match:'):
+            pattern = re.compile(arg[6:], re.IGNORECASE)
+        elif lowered.startswith('since:'):
+            duration = parse_time(arg[6:])
+            if not duration:
+                raise ValueError(f"Invalid time '{arg[6:]}', use something like 30m, 2h or 1d.")
+            since = discord.utils.utcnow() - duration
+        else:
+            raise ValueError(f"Unknown filter '{arg}'.")
+    
+    def matches(message):
+        if authors and message.author.id not in authors:
+            return False
+        if links and not URL_PATTERN.search(message.content):
+            return False
+        if attachments and not message.attachments:
+            return False
+        if pattern and not pattern.search(message.content):
+            return False
+        return True
+    
+    return matches, since
+
+@bot.command()
+async def purge(ctx, amount: int, *filters):
+    """Delete up to amount messages matching the given filters"""
+    if not await is_staff(ctx):
+        await ctx.send("You don't have permission to use this command.")
+        return
+    
+    if amount < 1 or amount > PURGE_MAX:
+        await ctx.send(f"Number must be between 1 and {PURGE_MAX}.")
+        return
+    
+    try:
+        matches, since = parse_purge_filters(ctx, filters)
+    except (ValueError, re.error) as e:
+        await ctx.send(f"Invalid filter: {str(e)}")
+        return
+    
+    channel = ctx.channel
+    status = await ctx.send("🧹 Purging messages...")
+    bulk_cutoff = discord.utils.utcnow() - PURGE_BULK_MAX_AGE
+    batch = []
+    deleted = scanned = 0
+    last_update = time.monotonic()
+    
+    async def report(final=False):
+        nonlocal last_update
+        if final or time.monotonic() - last_update >= PURGE_STATUS_INTERVAL:
+            last_update = time.monotonic()
+            text = "✅ Purge finished" if final else "🧹 Purging messages"
+            try:
+                await status.edit(content=f"{text}: {deleted} deleted, {scanned} checked.")
+            except:
+                pass
+    
+    try:
+        try:
+            await ctx.message.delete()
+        except:
+            pass
+        
+        # History streams newest first, so once a message is past a cutoff every later one is too
+        async for message in channel.history(limit=PURGE_SCAN_LIMIT, before=ctx.message):
+            scanned += 1
+            if since and message.created_at < since:
+                break
+            await report()
+            if not matches(message):
+                continue
+            
+            if message.created_at > bulk_cutoff:
+                batch.append(message)
+                if len(batch) == 100:
+                    await channel.delete_messages(batch)
+                    deleted += len(batch)
+                    batch = []
+            else:
+                if batch:
+                    await channel.delete_messages(batch)
+                    deleted += len(batch)
+                    batch = []
+                try:
+                    await message.delete()
+                    deleted += 1
+                except discord.NotFound:
+                    pass
+                await asyncio.sleep(PURGE_SINGLE_DELETE_DELAY)
+            
+            if deleted + len(batch) >= amount:
+                break
+        
+        if batch:
+            await channel.delete_messages(batch)
+            deleted += len(batch)
+        
+        await report(final=True)
+    except discord.Forbidden:
+        await status.edit(content="I don't have permission to delete messages in this channel.")
+    except Exception as e:
+        await status.edit(content=f"Error deleting messages after {deleted} were removed: {str(e)}")
+
 class RegionView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
@@ -1245,14 +2605,8 @@ class RegionView(discord.ui.View):
         
         region_roles = ['EU', 'US', 'ASIA', 'INW']
         
-        # Remove all other region roles
-        for role_name in region_roles:
-            role = discord.utils.get(guild.roles, name=role_name)
-            if role and role in member.roles:
-                try:
-                    await member.remove_roles(role, reason=f"Region changed to {region}")
-                except:
-                    pass
+        # All other region roles get removed in the same edit
+        old_roles = [role for role in member.roles if role.name in region_roles and role.name != region]
         
         # Add the new region role
         new_role = discord.utils.get(guild.roles, name=region)
@@ -1268,7 +2622,7 @@ class RegionView(discord.ui.View):
                 return
         
         try:
-            await member.add_roles(new_role, reason=f"Selected {region} region")
+            await update_member_roles(member, add=[new_role], remove=old_roles, reason=f"Selected {region} region")
             await interaction.response.send_message(
                 f"🎮 **Region Updated!** You've been assigned the **{region}** role for Stumble Guys! Get ready to stumble with players from your region! 🏃‍♂️💨",
                 ephemeral=True
@@ -1337,16 +2691,25 @@ async def commands(ctx):
         "`!mute @user <time> [reason]` - Mute user (1m-7d)",
         "`!unmute @user` - Remove mute from user",
         "`!ban @user [time] [reason]` - Ban user (temp if time given)",
-        "`!unban <username>` - Unban user",
+        "`!unban <username|id>` - Unban user",
         "`!kick @user [reason]` - Kick user from server",
+        "`!masswarn|masskick|massban @user... [reason]` - Act on many users",
+        "`!massmute <time> @user... [reason]` - Mute many users",
+        "Start a mass reason with `joined:<time>` to include recent joins",
         "`!delete_ticket` - Delete current ticket channel",
-        "`!delete <number>` - Delete number of messages (1-100)"
+        "`!delete <number>` - Delete number of messages (1-100)",
+        "`!purge <number> [@user...] [links] [attachments] [match:regex] [since:time]` - Delete matching messages"
     ]
     
     # Automod Commands
     automod_cmds = [
         "`!automod_enable` - Enable automatic moderation",
-        "`!automod_log #channel` - Set automod log channel"
+        "`!automod_log #channel` - Set automod log channel",
+        "`!automod_digest <on|off>` - Batch automod logs while busy",
+        "`!badwords [add|remove|reset] [words...]` - Manage bad words list",
+        "`!automod_rule <rule> <on|off>` - Toggle an automod rule",
+        "`!automod_stats` - Show automod rule hits and timing",
+        "`!raid_protection <joins|off> [alert|mute|kick|ban]` - Act on join floods"
     ]
     
     # Channel Management
@@ -1354,7 +2717,9 @@ async def commands(ctx):
         "`!spam #channel...` - Set spam-allowed channels",
         "`!link #channel...` - Set link-allowed channels", 
         "`!lock [@role...]` - Lock channel (allow roles if given)",
-        "`!unlock` - Unlock channel"
+        "`!unlock` - Unlock channel",
+        "`!lockdown [@role...]` - Lock every channel (allow roles if given)",
+        "`!unlockdown` - Restore every channel after a lockdown"
     ]
     
     # Leveling System
@@ -1362,7 +2727,9 @@ async def commands(ctx):
         "`!leveling_channel #channel` - Set level announcement channel",
         "`!levelrole @role <level>` - Add role reward for level",
         "`!levelrole elim @role` - Remove role from rewards",
-        "`!level [@user]` - Check user's level and XP"
+        "`!levelrole_sync` - Re-check level roles for all members",
+        "`!level [@user]` - Check user's level, XP and rank",
+        "`!leaderboard [page]` - Show the XP leaderboard"
     ]
     
     # Account & Tickets
@@ -1401,36 +2768,91 @@ async def commands(ctx):
     
     await ctx.send(embed=embed)
 
-# Background task to check level roles
-@tasks.loop(minutes=5)
-async def level_check():
-    """Periodically check and assign level roles"""
-    user_levels = load_json('user_levels.json')
-    level_roles = load_json('level_roles.json')
+# Level role reconciliation
+#
+# Instead of scanning every member on a timer, members are queued when their
+# level changes and the queue is worked through a few members at a time. Full
+# sweeps (after !levelrole or !levelrole_sync) feed the same queue in slices.
+LEVEL_ROLE_BATCH = 20
+
+# (guild_id, user_id) pairs waiting for a level role check, oldest first
+level_role_queue = {}
+
+# Full sweeps in progress: guild_id -> [user ids to check, position reached]
+level_role_sweeps = {}
+
+def queue_level_role_check(guild_id, user_id):
+    """Queue a member for a level role check"""
+    level_role_queue[(guild_id, user_id)] = None
+
+def start_level_role_sweep(guild_id):
+    """Queue every member with a level in the guild, a slice at a time"""
+    flush_xp_records(guild_id)
+    user_ids = sorted(user_id for user_id, _ in db.iter_levels(guild_id))
+    level_role_sweeps[guild_id] = [user_ids, 0]
+
+async def sync_level_roles(guild_id, user_id):
+    """Give a member every level role they have reached"""
+    guild = bot.get_guild(guild_id)
+    member = guild.get_member(user_id) if guild else None
+    user_data = get_member_level(guild_id, user_id)
+    if not member or not user_data:
+        return
     
-    for key, user_data in user_levels.items():
-        guild_id, user_id = key.split('_')
-        user_level = user_data.get('level', 0)
-        
-        guild = bot.get_guild(int(guild_id))
-        if not guild:
-            continue
-        
-        member = guild.get_member(int(user_id))
-        if not member:
-            continue
-        
-        # Check if user should have any level roles
-        guild_roles = level_roles.get(guild_id, {})
-        for level_num, role_ids in guild_roles.items():
-            if user_level >= int(level_num):
-                for role_id in role_ids:
-                    role = guild.get_role(int(role_id))
-                    if role and role not in member.roles:
-                        try:
-                            await member.add_roles(role, reason="Level role assignment")
-                        except:
-                            pass
+    user_level = user_data.get('level', 0)
+    guild_roles = guild_data(guild_id, 'level_roles')
+    
+    reached = []
+    for level_num, role_ids in guild_roles.items():
+        if user_level >= int(level_num):
+            reached.extend(guild.get_role(int(role_id)) for role_id in role_ids)
+    
+    try:
+        await update_member_roles(member, add=[role for role in reached if role], reason="Level role assignment")
+    except:
+        pass
+
+# Background task to work through the level role queue
+@tasks.loop(seconds=5)
+async def level_role_sync():
+    """Check a batch of queued members' level roles"""
+    # Top up the queue from running sweeps, keeping our place in each
+    for guild_id, sweep in list(level_role_sweeps.items()):
+        if len(level_role_queue) >= LEVEL_ROLE_BATCH:
+            break
+        user_ids, position = sweep
+        for user_id in user_ids[position:position + LEVEL_ROLE_BATCH]:
+            queue_level_role_check(guild_id, user_id)
+        sweep[1] = position + LEVEL_ROLE_BATCH
+        if sweep[1] >= len(user_ids):
+            del level_role_sweeps[guild_id]
+    
+    for _ in range(min(LEVEL_ROLE_BATCH, len(level_role_queue))):
+        guild_id, user_id = next(iter(level_role_queue))
+        del level_role_queue[(guild_id, user_id)]
+        try:
+            await sync_level_roles(guild_id, user_id)
+        except Exception as e:
+            print(f"Error syncing level roles: {e}")
+
+# Background task to write changed data back to disk
+@tasks.loop(seconds=FLUSH_INTERVAL)
+async def db_flush():
+    """Periodically flush changed data files"""
+    await flush_db_async()
+
+# Background task to write buffered XP grants
+@tasks.loop(seconds=XP_FLUSH_INTERVAL)
+async def xp_flush():
+    """Periodically move buffered XP into storage"""
+    flush_xp_records()
+
+# Background task to unload data of guilds that have gone quiet
+@tasks.loop(minutes=10)
+async def guild_eviction():
+    """Drop idle guilds' data from memory"""
+    flush_xp_records()
+    await evict_idle_guilds()
 
 # Error handling
 @bot.event
@@ -1447,8 +2869,14 @@ async def on_command_error(ctx, error):
 # Run the bot
 if __name__ == "__main__":
     keep_alive()
+    init_db()
     TOKEN = os.getenv("TOKEN")
     if not TOKEN:
         print("Please set the TOKEN environment variable")
     else:
-        bot.run(TOKEN)
+        try:
+            bot.run(TOKEN)
+        finally:
+            # Make sure nothing is lost on shutdown
+            flush_xp_records()
+            flush_db()
@@ -0,0 +1,735 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+# Directory holding one sub-directory of data files per guild
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+# Per-guild data files and their empty defaults
+GUILD_FILES = {
+    'levels': {},
+    'warnings': [],
+    'tickets': [],
+    'accounts': {},
+    'config': {},
+    'level_roles': {},
+    'automod': {},
+    'lockdown': {}
+}
+
+# Old single-file layout, split into per-guild files on first start
+LEGACY_FILES = {
+    'warnings.json': 'warnings',
+    'user_levels.json': 'levels',
+    'guild_config.json': 'config',
+    'level_roles.json': 'level_roles',
+    'automod_warnings.json': 'automod',
+    'user_accounts.json': 'accounts',
+    'tickets.json': 'tickets'
+}
+
+# How often (in seconds) changed files are written back to disk
+FLUSH_INTERVAL = int(os.getenv('DB_FLUSH_INTERVAL', '30'))
+
+# Guilds that have not been touched for this long (in seconds) can be evicted
+GUILD_IDLE_SECONDS = int(os.getenv('GUILD_IDLE_SECONDS', '3600'))
+
+# Pending timed moderation actions for every guild
+TIMERS_PATH = os.path.join(DATA_DIR, 'timers.json')
+
+# Loaded file contents by path, kept in memory until their guild is evicted
+_cache = {}
+
+# Files that changed since the last flush
+_dirty = set()
+
+# Background write task per file, so repeated saves collapse into one write
+_write_tasks = {}
+
+# Last time each loaded guild was used (time.monotonic)
+_guild_last_used = {}
+
+def _default_for(path):
+    """Return a fresh empty value for a data file"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [] if isinstance(GUILD_FILES.get(name), list) else {}
+
+def _read_file(path):
+    """Read a JSON file from disk"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _default_for(path)
+
+def _write_file(path, data):
+    """Write a JSON file atomically so a crash never leaves half a file behind
+
+    This also runs on worker threads. Compact json.dumps goes through the C
+    encoder without releasing the GIL, so the live data cannot change half way
+    through serializing it.
+    """
+    text = json.dumps(data)
+    tmp_name = f"{path}.tmp"
+    with open(tmp_name, 'w') as f:
+        f.write(text)
+    os.replace(tmp_name, path)
+
+def init_db():
+    """Create the data directory, split legacy files and open the record backend"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    _migrate_legacy_files()
+    db.setup()
+
+def load_json(path):
+    """Return the live in-memory data for a file, loading it on first use"""
+    if path not in _cache:
+        _cache[path] = _read_file(path)
+    return _cache[path]
+
+def save_json(path, data):
+    """Store data for a file and mark it to be written on the next flush"""
+    _cache[path] = data
+    _dirty.add(path)
+
+def flush_db():
+    """Write every changed file back to disk and commit pending records"""
+    while _dirty:
+        path = _dirty.pop()
+        _write_file(path, _cache[path])
+    db.flush()
+    for guild_id in list(_journals):
+        _fold_journal(guild_id)
+
+async def _write_loop(path):
+    """Keep writing a file on a worker thread until it has no unsaved changes"""
+    try:
+        while path in _dirty:
+            _dirty.discard(path)
+            try:
+                await asyncio.to_thread(_write_file, path, _cache[path])
+            except Exception as e:
+                print(f"Error saving {path}: {e}")
+                _dirty.add(path)
+                break
+    finally:
+        _write_tasks.pop(path, None)
+
+def schedule_write(path):
+    """Start a background write for a file, reusing one that is already running"""
+    task = _write_tasks.get(path)
+    if task is None:
+        task = asyncio.create_task(_write_loop(path))
+        _write_tasks[path] = task
+    return task
+
+async def save_json_async(path, data):
+    """Store data for a file and write it without blocking the event loop"""
+    save_json(path, data)
+    await schedule_write(path)
+
+async def flush_db_async():
+    """Write every changed file on worker threads and commit pending records"""
+    tasks = [schedule_write(path) for path in list(_dirty)]
+    if tasks:
+        await asyncio.gather(*tasks)
+    db.flush()
+
+# Per-guild storage
+#
+# Every guild has its own directory of data files, loaded the first time the
+# guild is touched, so a busy guild never makes the others pay for its size.
+# Event handlers load guilds through load_guild, which reads them on a worker
+# thread; anything else falls back to reading on the event loop.
+def guild_dir(guild_id):
+    return os.path.join(DATA_DIR, str(guild_id))
+
+def guild_path(guild_id, name):
+    return os.path.join(guild_dir(guild_id), f"{name}.json")
+
+def _touch_guild(guild_id):
+    """Mark a guild as used, loading its journal the first time"""
+    _guild_last_used[guild_id] = time.monotonic()
+    if guild_id not in _journals:
+        os.makedirs(guild_dir(guild_id), exist_ok=True)
+        _load_journal(guild_id, _read_journal(guild_id))
+
+# Guild loads running on worker threads
+_load_tasks = {}
+
+def _read_guild(guild_id):
+    """Read all of a guild's files and journal records (runs on a worker thread)"""
+    os.makedirs(guild_dir(guild_id), exist_ok=True)
+    files = {guild_path(guild_id, name): _read_file(guild_path(guild_id, name)) for name in GUILD_FILES}
+    return files, _read_journal(guild_id)
+
+async def _load_guild(guild_id):
+    """Read a guild on a worker thread and install it in memory"""
+    try:
+        files, records = await asyncio.to_thread(_read_guild, guild_id)
+        # Something may have loaded the guild synchronously while we were reading
+        if guild_id not in _journals:
+            for path, data in files.items():
+                _cache.setdefault(path, data)
+            _load_journal(guild_id, records)
+    finally:
+        _load_tasks.pop(guild_id, None)
+
+async def load_guild(guild_id):
+    """Load a guild's data on a worker thread so the event loop never reads it from disk
+
+    Event handlers call this before touching a guild. Code paths that skip it
+    (button callbacks, background tasks) still work, they just load the guild
+    synchronously through guild_data the first time.
+    """
+    if guild_id not in _journals:
+        task = _load_tasks.get(guild_id)
+        if task is None:
+            task = _load_tasks[guild_id] = asyncio.create_task(_load_guild(guild_id))
+        await task
+    _guild_last_used[guild_id] = time.monotonic()
+
+def guild_data(guild_id, name):
+    """Return the live data of one of a guild's files"""
+    _touch_guild(guild_id)
+    return load_json(guild_path(guild_id, name))
+
+def save_guild_data(guild_id, name):
+    """Mark one of a guild's files to be written on the next flush"""
+    save_json(guild_path(guild_id, name), guild_data(guild_id, name))
+
+async def save_guild_data_async(guild_id, name):
+    """Write one of a guild's files without blocking the event loop"""
+    await save_json_async(guild_path(guild_id, name), guild_data(guild_id, name))
+
+def stored_guild_ids():
+    """Return the ids of every guild that has data on disk"""
+    try:
+        return [int(name) for name in os.listdir(DATA_DIR) if name.isdigit()]
+    except FileNotFoundError:
+        return []
+
+async def evict_guild(guild_id):
+    """Write out a guild's data and drop it from memory"""
+    if guild_id not in _journals:
+        return
+    started = time.monotonic()
+
+    prefix = guild_dir(guild_id) + os.sep
+    tasks = [schedule_write(path) for path in list(_dirty) if path.startswith(prefix)]
+    if tasks:
+        await asyncio.gather(*tasks)
+    # Let a compaction journal() already started finish before running our own
+    j = _journals[guild_id]
+    if j.compact_task is not None and not j.compact_task.done():
+        await j.compact_task
+    if j.size:
+        await compact_journal(guild_id)
+
+    # Keep the guild if it was used while we were writing
+    if _guild_last_used.get(guild_id, 0) > started:
+        return
+    _journals.pop(guild_id).file.close()
+    _guild_last_used.pop(guild_id, None)
+    db.forget_guild(guild_id)
+    for path in [p for p in _cache if p.startswith(prefix)]:
+        del _cache[path]
+
+async def evict_idle_guilds(max_idle=GUILD_IDLE_SECONDS):
+    """Evict every guild that has not been used for max_idle seconds"""
+    now = time.monotonic()
+    for guild_id, last_used in list(_guild_last_used.items()):
+        if now - last_used >= max_idle:
+            await evict_guild(guild_id)
+
+def _migrate_legacy_files():
+    """Split the old global JSON files into per-guild files"""
+    legacy = {name: _read_file(filename) for filename, name in LEGACY_FILES.items() if os.path.exists(filename)}
+    if not legacy:
+        return
+
+    # Changes journaled by older versions were never folded into the files
+    warnings = legacy.get('warnings', [])
+    automod = legacy.get('automod', {})
+    if os.path.exists('journal.jsonl'):
+        with open('journal.jsonl', 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('op') == 'warn_add':
+                    warnings.append(record['warning'])
+                elif record.get('op') == 'warn_rmv':
+                    ids = set(record['ids'])
+                    warnings = [w for w in warnings if w.get('id') not in ids]
+                elif record.get('op') == 'automod_set':
+                    automod[record['key']] = record['count']
+
+    shards = {}
+    def shard(guild_id, name):
+        return shards.setdefault(str(guild_id), {}).setdefault(name, _default_for(name))
+
+    for w in warnings:
+        shard(w['guild_id'], 'warnings').append(w)
+    for t in legacy.get('tickets', []):
+        shard(t['guild_id'], 'tickets').append(t)
+    for name in ('levels', 'accounts'):
+        for key, data in legacy.get(name, {}).items():
+            guild_id, user_id = key.split('_')
+            shard(guild_id, name)[user_id] = data
+    for key, count in automod.items():
+        guild_id, user_id = key.split('_')
+        shard(guild_id, 'automod')[user_id] = count
+    for name in ('config', 'level_roles'):
+        for guild_id, data in legacy.get(name, {}).items():
+            shards.setdefault(guild_id, {})[name] = data
+
+    for guild_id, files in shards.items():
+        os.makedirs(guild_dir(guild_id), exist_ok=True)
+        for name, data in files.items():
+            _write_file(guild_path(guild_id, name), data)
+
+    for filename in list(LEGACY_FILES) + ['journal.jsonl']:
+        if os.path.exists(filename):
+            os.replace(filename, f"{filename}.migrated")
+
+# Append-only journal
+#
+# Warnings and automod counters change one record at a time, so instead of
+# rewriting their files every change is appended to the guild's JSON-lines
+# journal. The journal is replayed when the guild is loaded and folded back
+# into the files once it grows past JOURNAL_COMPACT_BYTES. Replaying a record
+# twice is harmless, so a crash during compaction never loses or duplicates
+# anything.
+JOURNAL_COMPACT_BYTES = int(os.getenv('JOURNAL_COMPACT_BYTES', str(1024 * 1024)))
+JOURNAL_FILES = ('warnings', 'automod')
+
+class GuildJournal:
+    """Open journal file of a loaded guild"""
+    __slots__ = ('path', 'file', 'size', 'next_warning_id', 'compact_task', 'compact_lock')
+
+    def __init__(self, path, next_warning_id):
+        self.path = path
+        self.file = open(path, 'a')
+        self.size = self.file.tell()
+        self.next_warning_id = next_warning_id
+        self.compact_task = None
+        # Only one compaction per guild may rename the journal and write its files
+        self.compact_lock = asyncio.Lock()
+
+    def reopen(self):
+        self.file.close()
+        self.file = open(self.path, 'a')
+        self.size = 0
+
+_journals = {}
+
+def _apply_journal_record(guild_id, record, known_ids=None):
+    """Apply one journal record to the in-memory data"""
+    op = record.get('op')
+    if op in ('warn_add', 'warn_add_many'):
+        warnings = load_json(guild_path(guild_id, 'warnings'))
+        for warning in record['warnings'] if op == 'warn_add_many' else [record['warning']]:
+            if known_ids is not None:
+                if warning['id'] in known_ids:
+                    continue
+                known_ids.add(warning['id'])
+            warnings.append(warning)
+    elif op == 'warn_rmv':
+        ids = set(record['ids'])
+        warnings = load_json(guild_path(guild_id, 'warnings'))
+        warnings[:] = [w for w in warnings if w.get('id') not in ids]
+    elif op == 'automod_set':
+        load_json(guild_path(guild_id, 'automod'))[str(record['user_id'])] = record['count']
+
+def _read_journal(guild_id):
+    """Return the records of a guild's journal, including one left by an unfinished compaction"""
+    records = []
+    path = os.path.join(guild_dir(guild_id), 'journal.jsonl')
+    for journal_path in (f"{path}.old", path):
+        try:
+            with open(journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Half written line from a crash
+                        continue
+        except FileNotFoundError:
+            pass
+    return records
+
+def _load_journal(guild_id, records):
+    """Give old warnings ids, replay a guild's journal and open it for appending"""
+    warnings = load_json(guild_path(guild_id, 'warnings'))
+    next_id = max((w['id'] for w in warnings if 'id' in w), default=0) + 1
+    for w in warnings:
+        if 'id' not in w:
+            w['id'] = next_id
+            next_id += 1
+            _dirty.add(guild_path(guild_id, 'warnings'))
+
+    known_ids = {w['id'] for w in warnings}
+    for record in records:
+        _apply_journal_record(guild_id, record, known_ids)
+
+    # Ids are never reused, even for warnings that were removed again
+    path = os.path.join(guild_dir(guild_id), 'journal.jsonl')
+    _journals[guild_id] = GuildJournal(path, max(known_ids, default=0) + 1)
+
+def journal(guild_id, record):
+    """Apply a change to a guild's in-memory data and append it to its journal"""
+    _touch_guild(guild_id)
+    _apply_journal_record(guild_id, record)
+    j = _journals[guild_id]
+    line = json.dumps(record) + '\n'
+    j.file.write(line)
+    j.file.flush()
+    j.size += len(line)
+    if j.size >= JOURNAL_COMPACT_BYTES and (j.compact_task is None or j.compact_task.done()):
+        try:
+            j.compact_task = asyncio.get_running_loop().create_task(compact_journal(guild_id))
+        except RuntimeError:
+            _fold_journal(guild_id)
+
+def next_warning_id(guild_id):
+    """Reserve an id for a new warning in a guild"""
+    _touch_guild(guild_id)
+    j = _journals[guild_id]
+    warning_id = j.next_warning_id
+    j.next_warning_id += 1
+    return warning_id
+
+async def compact_journal(guild_id):
+    """Fold a guild's journal into its files without blocking the event loop"""
+    j = _journals[guild_id]
+    async with j.compact_lock:
+        # A compaction that finished while we waited may have left nothing to do
+        if not j.size:
+            return
+        # Start a fresh journal first so changes made while we write keep being logged
+        j.file.close()
+        os.replace(j.path, f"{j.path}.old")
+        j.reopen()
+
+        for name in JOURNAL_FILES:
+            path = guild_path(guild_id, name)
+            await asyncio.to_thread(_write_file, path, load_json(path))
+        os.remove(f"{j.path}.old")
+
+def _fold_journal(guild_id):
+    """Write a guild's journaled files and empty its journal (used on shutdown)"""
+    j = _journals[guild_id]
+    for name in JOURNAL_FILES:
+        path = guild_path(guild_id, name)
+        _write_file(path, load_json(path))
+    j.file.close()
+    if os.path.exists(f"{j.path}.old"):
+        os.remove(f"{j.path}.old")
+    os.remove(j.path)
+    j.reopen()
+
+def get_automod_count(guild_id, user_id):
+    """Return a user's current automod warning count"""
+    return guild_data(guild_id, 'automod').get(str(user_id), 0)
+
+def set_automod_count(guild_id, user_id, count):
+    """Change a user's automod warning count"""
+    journal(guild_id, {'op': 'automod_set', 'user_id': user_id, 'count': count})
+
+# Record storage
+#
+# Levels, warnings, tickets and accounts go through a backend object so they
+# can live either in the per-guild JSON files above or in an indexed SQLite
+# database. Set DB_BACKEND=sqlite to use the database (path from DB_PATH).
+DB_BACKEND = os.getenv('DB_BACKEND', 'json').lower()
+DB_PATH = os.getenv('DB_PATH', 'bot.db')
+
+class JsonBackend:
+    """Record storage on top of the per-guild JSON files"""
+
+    def __init__(self):
+        # Open tickets per guild: (tickets list, {user_id: ticket}, {channel_id: ticket})
+        self._open_tickets = {}
+
+    def setup(self):
+        pass
+
+    def forget_guild(self, guild_id):
+        self._open_tickets.pop(guild_id, None)
+
+    def get_level(self, guild_id, user_id):
+        return guild_data(guild_id, 'levels').get(str(user_id))
+
+    def set_level(self, guild_id, user_id, data):
+        guild_data(guild_id, 'levels')[str(user_id)] = data
+        save_guild_data(guild_id, 'levels')
+
+    def iter_levels(self, guild_id):
+        """Yield (user_id, data) for every leveling record in a guild"""
+        for user_id, data in list(guild_data(guild_id, 'levels').items()):
+            yield int(user_id), data
+
+    def get_warnings(self, guild_id, user_id):
+        return [w for w in guild_data(guild_id, 'warnings') if w['user_id'] == user_id]
+
+    def add_warning(self, guild_id, user_id, reason, timestamp):
+        journal(guild_id, {'op': 'warn_add', 'warning': {
+            'id': next_warning_id(guild_id),
+            'user_id': user_id,
+            'guild_id': guild_id,
+            'reason': reason,
+            'timestamp': timestamp
+        }})
+
+    def add_warnings(self, guild_id, user_ids, reason, timestamp):
+        """Warn several users at once with a single journal record"""
+        journal(guild_id, {'op': 'warn_add_many', 'warnings': [{
+            'id': next_warning_id(guild_id),
+            'user_id': user_id,
+            'guild_id': guild_id,
+            'reason': reason,
+            'timestamp': timestamp
+        } for user_id in user_ids]})
+
+    def remove_warnings(self, guild_id, user_id, count):
+        """Remove a user's most recent warnings and return how many were removed"""
+        user_warnings = self.get_warnings(guild_id, user_id)
+        removed = user_warnings[-count:] if count > 0 else []
+        if removed:
+            journal(guild_id, {'op': 'warn_rmv', 'ids': [w['id'] for w in removed]})
+        return len(removed)
+
+    def _ticket_index(self, guild_id):
+        """Return the open ticket index of a guild, building it on first use"""
+        tickets = guild_data(guild_id, 'tickets')
+        index = self._open_tickets.get(guild_id)
+        if index is None or index[0] is not tickets:
+            by_user, by_channel = {}, {}
+            for t in tickets:
+                if not t.get('closed', False):
+                    by_user.setdefault(t['user_id'], t)
+                    by_channel.setdefault(t['channel_id'], t)
+            index = self._open_tickets[guild_id] = (tickets, by_user, by_channel)
+        return index
+
+    def get_open_ticket(self, guild_id, user_id):
+        return self._ticket_index(guild_id)[1].get(user_id)
+
+    def get_ticket_by_channel(self, guild_id, channel_id):
+        return self._ticket_index(guild_id)[2].get(channel_id)
+
+    def add_ticket(self, ticket):
+        tickets, by_user, by_channel = self._ticket_index(ticket['guild_id'])
+        tickets.append(ticket)
+        if not ticket.get('closed', False):
+            by_user[ticket['user_id']] = ticket
+            by_channel[ticket['channel_id']] = ticket
+        save_guild_data(ticket['guild_id'], 'tickets')
+
+    def close_ticket(self, guild_id, channel_id, closed_at):
+        tickets, by_user, by_channel = self._ticket_index(guild_id)
+        ticket = by_channel.pop(channel_id, None)
+        if ticket:
+            ticket['closed'] = True
+            ticket['closed_at'] = closed_at
+            if by_user.get(ticket['user_id']) is ticket:
+                del by_user[ticket['user_id']]
+            save_guild_data(guild_id, 'tickets')
+
+    def get_account(self, guild_id, user_id):
+        return guild_data(guild_id, 'accounts').get(str(user_id))
+
+    def set_account(self, guild_id, user_id, data):
+        guild_data(guild_id, 'accounts')[str(user_id)] = data
+        save_guild_data(guild_id, 'accounts')
+
+    def flush(self):
+        pass
+
+class SqliteBackend:
+    """Record storage in an indexed SQLite database (WAL mode)
+
+    Every table is keyed by guild_id first, so the indexes partition the data
+    per guild the same way the JSON files do. Writes are collected in one open
+    transaction and committed on flush.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS levels (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            xp INTEGER NOT NULL DEFAULT 0,
+            level INTEGER NOT NULL DEFAULT 0,
+            last_message TEXT,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS warnings (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            reason TEXT,
+            timestamp TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_warnings_member ON warnings (guild_id, user_id);
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            ticket_type TEXT,
+            created_at TEXT,
+            closed INTEGER NOT NULL DEFAULT 0,
+            closed_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_tickets_channel ON tickets (channel_id);
+        CREATE INDEX IF NOT EXISTS idx_tickets_member ON tickets (guild_id, user_id, closed);
+        CREATE TABLE IF NOT EXISTS accounts (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            ign TEXT,
+            linked_at TEXT,
+            PRIMARY KEY (guild_id, user_id)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def forget_guild(self, guild_id):
+        pass
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        self._import_json()
+        self.conn.commit()
+
+    def _import_json(self):
+        """Copy records from the JSON files the first time the database is used"""
+        if self.conn.execute('SELECT 1 FROM levels LIMIT 1').fetchone():
+            return
+        if self.conn.execute('SELECT 1 FROM warnings LIMIT 1').fetchone():
+            return
+
+        for guild_id in stored_guild_ids():
+            for user_id, data in _read_file(guild_path(guild_id, 'levels')).items():
+                self.set_level(guild_id, int(user_id), data)
+            for w in guild_data(guild_id, 'warnings'):
+                self.add_warning(guild_id, w['user_id'], w.get('reason'), w.get('timestamp'))
+            for t in _read_file(guild_path(guild_id, 'tickets')):
+                self.add_ticket(t)
+            for user_id, data in _read_file(guild_path(guild_id, 'accounts')).items():
+                self.set_account(guild_id, int(user_id), data)
+
+    def get_level(self, guild_id, user_id):
+        row = self.conn.execute(
+            'SELECT xp, level, last_message FROM levels WHERE guild_id = ? AND user_id = ?',
+            (guild_id, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def set_level(self, guild_id, user_id, data):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO levels (guild_id, user_id, xp, level, last_message) VALUES (?, ?, ?, ?, ?)',
+            (guild_id, user_id, data.get('xp', 0), data.get('level', 0), data.get('last_message'))
+        )
+
+    def iter_levels(self, guild_id):
+        """Yield (user_id, data) for every leveling record in a guild"""
+        rows = self.conn.execute(
+            'SELECT user_id, xp, level, last_message FROM levels WHERE guild_id = ?',
+            (guild_id,)
+        ).fetchall()
+        for row in rows:
+            yield row['user_id'], {'xp': row['xp'], 'level': row['level'], 'last_message': row['last_message']}
+
+    def get_warnings(self, guild_id, user_id):
+        rows = self.conn.execute(
+            'SELECT guild_id, user_id, reason, timestamp FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY id',
+            (guild_id, user_id)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def add_warning(self, guild_id, user_id, reason, timestamp):
+        self.conn.execute(
+            'INSERT INTO warnings (guild_id, user_id, reason, timestamp) VALUES (?, ?, ?, ?)',
+            (guild_id, user_id, reason, timestamp)
+        )
+
+    def add_warnings(self, guild_id, user_ids, reason, timestamp):
+        """Warn several users at once"""
+        self.conn.executemany(
+            'INSERT INTO warnings (guild_id, user_id, reason, timestamp) VALUES (?, ?, ?, ?)',
+            [(guild_id, user_id, reason, timestamp) for user_id in user_ids]
+        )
+
+    def remove_warnings(self, guild_id, user_id, count):
+        """Remove a user's most recent warnings and return how many were removed"""
+        cursor = self.conn.execute(
+            'DELETE FROM warnings WHERE id IN ('
+            'SELECT id FROM warnings WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?)',
+            (guild_id, user_id, max(count, 0))
+        )
+        return cursor.rowcount
+
+    def _ticket(self, row):
+        if not row:
+            return None
+        ticket = dict(row)
+        del ticket['id']
+        ticket['closed'] = bool(ticket['closed'])
+        return ticket
+
+    def get_open_ticket(self, guild_id, user_id):
+        row = self.conn.execute(
+            'SELECT * FROM tickets WHERE guild_id = ? AND user_id = ? AND closed = 0 LIMIT 1',
+            (guild_id, user_id)
+        ).fetchone()
+        return self._ticket(row)
+
+    def get_ticket_by_channel(self, guild_id, channel_id):
+        row = self.conn.execute(
+            'SELECT * FROM tickets WHERE channel_id = ? AND closed = 0 LIMIT 1',
+            (channel_id,)
+        ).fetchone()
+        return self._ticket(row)
+
+    def add_ticket(self, ticket):
+        self.conn.execute(
+            'INSERT INTO tickets (guild_id, user_id, channel_id, ticket_type, created_at, closed, closed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (ticket['guild_id'], ticket['user_id'], ticket['channel_id'], ticket.get('ticket_type'),
+             ticket.get('created_at'), int(ticket.get('closed', False)), ticket.get('closed_at'))
+        )
+
+    def close_ticket(self, guild_id, channel_id, closed_at):
+        self.conn.execute(
+            'UPDATE tickets SET closed = 1, closed_at = ? WHERE channel_id = ? AND closed = 0',
+            (closed_at, channel_id)
+        )
+
+    def get_account(self, guild_id, user_id):
+        row = self.conn.execute(
+            'SELECT ign, linked_at FROM accounts WHERE guild_id = ? AND user_id = ?',
+            (guild_id, user_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def set_account(self, guild_id, user_id, data):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO accounts (guild_id, user_id, ign, linked_at) VALUES (?, ?, ?, ?)',
+            (guild_id, user_id, data.get('ign'), data.get('linked_at'))
+        )
+
+    def flush(self):
+        self.conn.commit()
+
+db = SqliteBackend(DB_PATH) if DB_BACKEND == 'sqlite' else JsonBackend()